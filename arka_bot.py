@@ -1,29 +1,66 @@
 import os
-import requests
-import xmltodict
+import re
+import time
+import signal
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import functools
+import threading
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                TimeoutError, as_completed, wait)
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+from xml.etree import ElementTree
 
 from telegram import Update
 from telegram.ext import (Updater, CommandHandler, MessageHandler,
                           CallbackContext, Filters)
 
 from dotenv import load_dotenv
-from yandex_errors_dict import ya_error_lib
+from async_runner import EventLoopThread
+from circuit_breaker import (OPEN, CallDeadline, CircuitBreaker, CircuitOpen,
+                             current_deadline)
+from daily_stats import DailyStatsCache
+from http_client import async_request, create_async_client, create_session
+from lookup_report import LookupReport
+from metrics import MetricsServer, metrics
+from offer_index import OfferIndex
+from rate_limiter import (BACKGROUND, INTERACTIVE, ConcurrencyLimit,
+                          RateLimiter, RateLimitTimeout, in_background)
+from result_cache import ResultCache
+from storage import ListingStore
+from structured_logging import (log_platform, lookup_trace,
+                                platform_context, setup_logging,
+                                submit_with_context, trace_id)
+from telegram_sender import TelegramSender
+from token_manager import TokenManager
+from watchlist import WatchList
+from webhook_server import WebhookServer
+from yandex_errors import YandexErrorStats, describe_errors
 
 load_dotenv()
 
-logging.basicConfig(
-    filename='app.log',  # Имя файла для записи логов
-    level=logging.INFO,  # Уровень логирования
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Журнал: файл, размер до ротации (байт), число архивов и формат
+# (json — запись JSON в строке, text — прежний текстовый)
+LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+
+setup_logging(LOG_FILE, logging.INFO, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+              LOG_FORMAT == 'json')
 
 GREEN_CHECKMARK = "✅"
 RED_CROSS = "❌"
 PHONE = "📞"
 HEART = "❤️"
 MAGNIFYING_GLASS = "🔎"
+WARNING_SIGN = "⚠️"
+MINUS_SIGN = "➖"
+QUESTION_MARK = "❔"
+CLOCK = "🕒"
+BELL = "🔔"
 
 
 TELEGRAM_TOKEN_AVITO = os.getenv('TELEGRAM_TOKEN_AVITO')
@@ -49,90 +86,421 @@ URL_GET_AVITO_URL = (
     f'https://api.avito.ru/core/v1/accounts/{AVITO_ID_COMPANY}/items/')
 URL_GET_AVITO_STATS = (
     f'https://api.avito.ru/stats/v1/accounts/{AVITO_ID_COMPANY}/items')
+URL_GET_AVITO_ITEMS = 'https://api.avito.ru/core/v1/items'
 
 URL_GET_YANDEX_FEED = 'https://api.realty.yandex.net/2.0/crm/offers'
 URL_GET_CIAN_FEED = 'https://public-api.cian.ru/v1/get-order'
 URL_GET_DOMCLICK_REPORT = (
     f'https://my.domclick.ru/api/v1/company/{DOMCLICK_ID_COMPANY}/report/')
-
-# Глобальные переменные
-global_token = None
-global_id_avito = None
-global_found_ya_offer = False
-
-
-def get_new_token():
-    """Обновление токена авито."""
-    global global_token
+URL_TELEGRAM_SEND_MESSAGE = (
+    f'https://api.telegram.org/bot{TELEGRAM_TOKEN_AVITO}/sendMessage')
+URL_TELEGRAM_EDIT_MESSAGE = (
+    f'https://api.telegram.org/bot{TELEGRAM_TOKEN_AVITO}/editMessageText')
+
+# HTTP-клиенты площадок: таймауты (с), повторы и размер пула на хост
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.5))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+
+# Токен Авито: запас до истечения для упреждающего обновления (с)
+# и число повторов запроса после ответа 403
+AVITO_TOKEN_REFRESH_MARGIN = int(os.getenv('AVITO_TOKEN_REFRESH_MARGIN', 600))
+AVITO_TOKEN_CHECK_INTERVAL = int(os.getenv('AVITO_TOKEN_CHECK_INTERVAL', 60))
+AVITO_AUTH_RETRIES = int(os.getenv('AVITO_AUTH_RETRIES', 1))
+
+# Размеры пачек в запросах к Авито
+AVITO_IDS_BATCH_SIZE = 50
+AVITO_STATS_BATCH_SIZE = 200
+AVITO_ITEMS_PAGE_SIZE = 100
+# До стольких объявлений ссылки запрашиваются по одному, а не обходом
+# всех объявлений компании
+AVITO_ITEM_LOOKUP_LIMIT = 10
+# Статистика Авито по всем объявлениям (/portfolio): пауза между пачками, с,
+# срок годности данных за текущий день, с, и ограничения периода и рейтинга
+AVITO_STATS_BATCH_PAUSE = float(os.getenv('AVITO_STATS_BATCH_PAUSE', 0.5))
+AVITO_TODAY_STATS_TTL = int(os.getenv('AVITO_TODAY_STATS_TTL', 600))
+PORTFOLIO_DEFAULT_DAYS = 7
+PORTFOLIO_MAX_DAYS = 270
+PORTFOLIO_DEFAULT_TOP = 5
+PORTFOLIO_MAX_TOP = 50
+
+# Индекс заказа ЦИАН: период фонового обновления и срок годности, с
+CIAN_INDEX_REFRESH = int(os.getenv('CIAN_INDEX_REFRESH', 300))
+CIAN_INDEX_TTL = int(os.getenv('CIAN_INDEX_TTL', 600))
+
+YANDEX_PAGE_SIZE = 100
+# Сколько страниц фида Яндекса загружать одновременно
+YANDEX_PAGE_CONCURRENCY = int(os.getenv('YANDEX_PAGE_CONCURRENCY', 5))
+# Индекс фида Яндекса: период фонового обновления и срок годности, с
+YANDEX_INDEX_REFRESH = int(os.getenv('YANDEX_INDEX_REFRESH', 300))
+YANDEX_INDEX_TTL = int(os.getenv('YANDEX_INDEX_TTL', 900))
+
+# Индекс отчёта ДомКлик: период фонового обновления и срок годности, с
+DOMCLICK_INDEX_REFRESH = int(os.getenv('DOMCLICK_INDEX_REFRESH', 300))
+DOMCLICK_INDEX_TTL = int(os.getenv('DOMCLICK_INDEX_TTL', 600))
+
+# Пакетная проверка: максимум листингов в одном сообщении
+BATCH_MAX_LISTINGS = int(os.getenv('BATCH_MAX_LISTINGS', 100))
+# Ограничение Telegram на длину сообщения с запасом
+MESSAGE_MAX_LENGTH = 4000
+
+# Кэш ответов площадок по листингу: срок жизни (с) и число записей
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 120))
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 1000))
+# Постоянный кэш в SQLite (токен Авито, индексы площадок и недавние ответы
+# переживают перезапуск): путь к файлу, пусто — выключен. Ответы проверок
+# от него не меняются, в отличие от локальной базы SYNC_DB_PATH
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', '')
+# Сколько хранится сохранённый при остановке индекс площадки, с
+SAVED_INDEX_MAX_AGE = 24 * 3600
+
+# Фоновая синхронизация площадок в локальную базу SQLite: путь к файлу
+# (пусто — выключена), период синхронизации и срок годности данных, с
+SYNC_DB_PATH = os.getenv('SYNC_DB_PATH', '')
+SYNC_INTERVAL = int(os.getenv('SYNC_INTERVAL', 600))
+SYNC_MAX_AGE = int(os.getenv('SYNC_MAX_AGE', 1800))
+# Период проверки отслеживаемых листингов (/watch), с; 0 — выключена
+WATCH_INTERVAL = int(os.getenv('WATCH_INTERVAL', 300))
+
+# Число потоков для одновременных проверок и сколько проверок (с ожидающими
+# своей очереди) бот принимает, прежде чем отвечать отказом; 0 — без предела
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 8))
+MAX_PENDING_LOOKUPS = int(os.getenv('MAX_PENDING_LOOKUPS', 100))
+# Получение обновлений: polling — long polling, webhook — HTTP-эндпоинт
+BOT_UPDATES = os.getenv('BOT_UPDATES', 'polling')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+# Путь эндпоинта по умолчанию — токен бота, как в PTB start_webhook, чтобы
+# поддельные обновления нельзя было отправить по угаданному адресу
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH') or TELEGRAM_TOKEN_AVITO
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (необязателен)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# Публичный адрес webhook; без него бот не регистрирует webhook в Telegram,
+# что удобно для локальной проверки записанными обновлениями
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', 20))
+WEBHOOK_MAX_BACKLOG = int(os.getenv('WEBHOOK_MAX_BACKLOG', 100))
+# Режим проверок: threads — пул потоков, async — корутины в цикле asyncio
+BOT_MODE = os.getenv('BOT_MODE', 'threads')
+ASYNC_MAX_LOOKUPS = int(os.getenv('ASYNC_MAX_LOOKUPS', 500))
+# Потоки для загрузки отчёта ДомКлик в асинхронном режиме
+ASYNC_DOMCLICK_WORKERS = int(os.getenv('ASYNC_DOMCLICK_WORKERS', 4))
+
+# Параллельный опрос площадок
+PARALLEL_LOOKUP = os.getenv('PARALLEL_LOOKUP', '1') == '1'
+PLATFORM_WORKERS = int(os.getenv('PLATFORM_WORKERS', 16))
+PLATFORM_TIMEOUT = int(os.getenv('PLATFORM_TIMEOUT', 30))
+# Эндпоинт метрик Prometheus: адрес и порт (0 — выключен)
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+# Чаты, которым доступны служебные команды; пусто — всем
+ADMIN_CHAT_IDS = {
+    int(chat_id) for chat_id in
+    os.getenv('ADMIN_CHAT_IDS', '').replace(',', ' ').split()
+}
+
+# Ограничение частоты запросов к площадкам: запросов в секунду (0 — без
+# ограничения) и сколько запросов можно отправить подряд
+PLATFORM_RATE_LIMITS = {
+    'CIAN': (float(os.getenv('CIAN_RATE_LIMIT', 5)),
+             int(os.getenv('CIAN_RATE_BURST', 10))),
+    'Yandex': (float(os.getenv('YANDEX_RATE_LIMIT', 10)),
+               int(os.getenv('YANDEX_RATE_BURST', 20))),
+    'Avito': (float(os.getenv('AVITO_RATE_LIMIT', 5)),
+              int(os.getenv('AVITO_RATE_BURST', 10))),
+    'DomClick': (float(os.getenv('DOMCLICK_RATE_LIMIT', 1)),
+                 int(os.getenv('DOMCLICK_RATE_BURST', 2))),
+}
+# Сколько проверка пользователя готова ждать очереди к площадке, с
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 10))
+# Автоматы площадок: после CIRCUIT_FAILURES ошибок или ответов дольше
+# CIRCUIT_SLOW_CALL секунд подряд площадка CIRCUIT_RESET_TIMEOUT секунд
+# считается недоступной (0 ошибок — автоматы выключены)
+CIRCUIT_FAILURES = int(os.getenv('CIRCUIT_FAILURES', 5))
+CIRCUIT_SLOW_CALL = float(os.getenv('CIRCUIT_SLOW_CALL', 20))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 60))
+# Исходящие сообщения Telegram: в секунду на бота и в один чат (0 — без
+# ограничения); правки сводного ответа не чаще раза в столько секунд
+TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', 25))
+TELEGRAM_CHAT_RATE_LIMIT = float(os.getenv('TELEGRAM_CHAT_RATE_LIMIT', 1))
+REPORT_UPDATE_INTERVAL = float(os.getenv('REPORT_UPDATE_INTERVAL', 1))
+
+PLATFORM_TIMEOUTS = {
+    'CIAN': int(os.getenv('CIAN_TIMEOUT', PLATFORM_TIMEOUT)),
+    'Yandex': int(os.getenv('YANDEX_TIMEOUT', PLATFORM_TIMEOUT)),
+    'Avito': int(os.getenv('AVITO_TIMEOUT', PLATFORM_TIMEOUT)),
+    'DomClick': int(os.getenv('DOMCLICK_TIMEOUT', PLATFORM_TIMEOUT)),
+}
+
+platform_executor = ThreadPoolExecutor(
+    max_workers=PLATFORM_WORKERS, thread_name_prefix='platform')
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+listing_store = ListingStore(SYNC_DB_PATH) if SYNC_DB_PATH else None
+cache_store = ListingStore(CACHE_DB_PATH) if CACHE_DB_PATH else None
+watch_list = WatchList(listing_store)
+avito_daily_stats = DailyStatsCache(AVITO_TODAY_STATS_TTL, listing_store)
+yandex_page_executor = ThreadPoolExecutor(
+    max_workers=YANDEX_PAGE_CONCURRENCY, thread_name_prefix='yandex-page')
+
+
+rate_limiters = {
+    platform: RateLimiter(platform, rate, burst, RATE_LIMIT_MAX_WAIT)
+    for platform, (rate, burst) in PLATFORM_RATE_LIMITS.items()
+}
+circuit_breakers = {
+    platform: CircuitBreaker(
+        platform, CIRCUIT_FAILURES, CIRCUIT_SLOW_CALL, CIRCUIT_RESET_TIMEOUT)
+    for platform in PLATFORM_TIMEOUTS
+}
+
+
+def platform_call(platform):
+    """Блок с запросами к площадке через её автомат.
+
+    Ответы по индексам в автомат не попадают: они не зависят от того,
+    отвечает ли площадка сейчас.
+    """
+    return circuit_breakers[platform].guard(ignore=RateLimitTimeout)
+
+
+telegram_sender = TelegramSender(
+    TELEGRAM_RATE_LIMIT, 30, TELEGRAM_CHAT_RATE_LIMIT, 3)
+
+
+# POST-запросы этих площадок (токен и статистика Авито) только читают
+# данные, и их можно повторять как GET
+RETRY_POST_PLATFORMS = ('Avito',)
+
+
+def create_platform_session(platform):
+    return create_session(
+        HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF,
+        HTTP_POOL_SIZE, name=platform, limiter=rate_limiters[platform],
+        retry_post=platform in RETRY_POST_PLATFORMS)
+
+
+avito_session = create_platform_session('Avito')
+cian_session = create_platform_session('CIAN')
+yandex_session = create_platform_session('Yandex')
+domclick_session = create_platform_session('DomClick')
+
+metrics.describe(
+    'arka_handler_seconds', 'histogram',
+    'Время обработчика площадки без кэша и локальной базы, с')
+metrics.describe(
+    'arka_store_replies_total', 'counter',
+    'Ответы площадок из локальной базы')
+metrics.describe(
+    'arka_platform_failures_total', 'counter',
+    'Ошибки и таймауты площадок при проверках')
+metrics.describe(
+    'arka_avito_auth_retries_total', 'counter',
+    'Повторы запросов Авито после ответа 403')
+metrics.describe(
+    'arka_yandex_scan_pages', 'histogram',
+    'Страниц фида, загруженных за один обход Яндекса',
+    buckets=(1, 2, 3, 5, 10, 20, 50))
+metrics.add_gauge(
+    'arka_rate_limit_waiting', 'Запросов в очереди к площадке',
+    lambda: [({'platform': limiter.name, 'priority': priority}, count)
+             for limiter in rate_limiters.values()
+             for priority, count in limiter.waiting.items()])
+metrics.add_gauge(
+    'arka_rate_limit_rejected', 'Проверок, не дождавшихся очереди',
+    lambda: [({'platform': limiter.name}, limiter.rejected)
+             for limiter in rate_limiters.values()])
+metrics.add_gauge(
+    'arka_pending_lookups', 'Принятые и ещё не завершённые проверки',
+    lambda: [({}, pending_lookups.active)])
+metrics.add_gauge(
+    'arka_rejected_lookups', 'Проверки, отклонённые из-за перегрузки',
+    lambda: [({}, pending_lookups.rejected)])
+metrics.add_gauge(
+    'arka_circuit_open', 'Автомат площадки разомкнут (1) или нет (0)',
+    lambda: [({'platform': breaker.name}, int(breaker.state == OPEN))
+             for breaker in circuit_breakers.values()])
+metrics.add_gauge(
+    'arka_circuit_rejected', 'Проверок, отклонённых автоматом площадки',
+    lambda: [({'platform': breaker.name}, breaker.rejected)
+             for breaker in circuit_breakers.values()])
+metrics.add_gauge(
+    'arka_yandex_error_listings', 'Объявлений фида Яндекса с кодом ошибки',
+    lambda: [({'code': code}, count)
+             for code, _, count, _ in yandex_errors.summary()])
+metrics.add_gauge(
+    'arka_result_cache_requests', 'Обращения к кэшу ответов с запуска',
+    lambda: [({'result': 'hit'}, result_cache.hits),
+             ({'result': 'miss'}, result_cache.misses)])
+metrics.add_gauge(
+    'arka_index_entries', 'Объявлений в индексах площадок',
+    lambda: [({'index': index.name}, len(index))
+             for index in (cian_index, yandex_index, domclick_index)])
+metrics.add_gauge(
+    'arka_index_age_seconds', 'Время с последнего обновления индекса, с',
+    lambda: [({'index': index.name}, time.time() - index.refreshed_at)
+             for index in (cian_index, yandex_index, domclick_index)
+             if index.refreshed_at is not None])
+
+
+@dataclass
+class LookupResult:
+    """Состояние одной проверки листинга.
+
+    Создаётся на каждый запрос и передаётся во все обработчики площадок,
+    поэтому одновременные проверки не видят данных друг друга.
+    refresh требует свежих данных в обход кэшей и индексов.
+    """
+    listing_id: str
+    refresh: bool = False
+    avito_id: Optional[int] = None
+    yandex_found: bool = False
+    yandex_failed: bool = False
+
+
+class PlatformError(Exception):
+    """Площадка не дала окончательного ответа: код ошибки, нет токена,
+    отчёт не загрузился.
+
+    Такой результат не кэшируется. replies — строки для пользователя
+    вместо общего сообщения об ошибке.
+    """
+
+    def __init__(self, message, replies=None):
+        super().__init__(message)
+        self.replies = replies
+
+
+def fetch_avito_token():
+    """Получение нового токена авито."""
     payload = {
         'grant_type': 'client_credentials',
         'client_id': AVITO_CLIENT_ID,
         'client_secret': AVITO_CLIENT_SECRET
     }
-    response = requests.post(URL_GET_AVITO_TOKEN, data=payload)
+    response = avito_session.post(URL_GET_AVITO_TOKEN, data=payload)
     if response.status_code == 200:
         data = response.json()
-        global_token = data.get('access_token')
-        return True
-    return False
+        return data.get('access_token'), data.get('expires_in', 0)
+    logging.warning(
+        "Ошибка при получении токена Авито. Код ответа: %s",
+        response.status_code)
+    return None
 
 
-def get_id_avito(user_input):
-    """Получение id объекта авито по листингу."""
-    global global_token, global_id_avito
-    url = f'{URL_GET_AVITO_ID_LISTING}{user_input}'
-    headers = {'Authorization': f'Bearer {global_token}'}
-    response = requests.get(url, headers=headers)
+avito_token = TokenManager(
+    'Avito', fetch_avito_token, AVITO_TOKEN_REFRESH_MARGIN, cache_store)
 
-    if response.status_code == 200:
-        data = response.json()
-        items = data.get('items')
-        if items:
-            global_id_avito = items[0].get('avito_id')
 
-    elif response.status_code == 403:
-        if get_new_token():
-            return get_id_avito(user_input)
-        else:
-            logging.warning(
-                "Ошибка при выполнении запроса на стороне Авито. "
-                "Код ответа: %s", response)
-    else:
-        logging.warning(
-            "Ошибка при выполнении запроса на стороне Авито. Код ответа: %s",
-            response.status_code)
+@in_background
+def refresh_avito_token(context: CallbackContext):
+    """Плановое обновление токена авито до истечения срока."""
+    avito_token.refresh_if_needed()
 
 
-def get_item_avito_status(global_avito_id):
-    """Получаение статуса на авито."""
-    global global_token
-    url = f'{URL_GET_AVITO_URL}{global_avito_id}/'
-    headers = {'Authorization': f'Bearer {global_token}'}
-    response = requests.get(url, headers=headers)
+def avito_request(method, url, **kwargs):
+    """Запрос к API авито с токеном.
 
-    if response.status_code == 200:
-        data = response.json()
-        status = data.get('status')
-        if status == "active":
-            return data.get('url')
-        else:
+    После ответа 403 токен обновляется и запрос повторяется не более
+    AVITO_AUTH_RETRIES раз. Возвращает None, если токен получить не удалось.
+    """
+    token = avito_token.get()
+    for attempt in range(AVITO_AUTH_RETRIES + 1):
+        if token is None:
             return None
-    else:
-        logging.warning(
-            "Ошибка при выполнении запроса на стороне Авито. Код ответа: %s",
-            response.status_code)
+        headers = {'Authorization': f'Bearer {token}'}
+        response = avito_session.request(method, url, headers=headers,
+                                         **kwargs)
+        if response.status_code != 403 or attempt == AVITO_AUTH_RETRIES:
+            break
+        metrics.inc('arka_avito_auth_retries_total')
+        token = avito_token.refresh(stale_token=token)
+    return response
+
+
+def log_avito_error(response):
+    logging.warning(
+        "Ошибка при выполнении запроса на стороне Авито. Код ответа: %s",
+        response.status_code)
+
+
+def check_avito_response(response, expected=(200,)):
+    """Ответ авито; PlatformError, если нет токена или код ошибочный."""
+    if response is None:
+        raise PlatformError(
+            "Не удалось получить токен Avito",
+            ["Не удалось получить токен Avito. Попробуйте позже."])
+    if response.status_code not in expected:
+        log_avito_error(response)
+        raise PlatformError(f"Код ответа Авито: {response.status_code}")
+    return response
+
+
+def avito_id_from_response(response):
+    """Id объявления авито из ответа avito_ids или None."""
+    items = check_avito_response(response).json().get('items')
+    if items:
+        return items[0].get('avito_id')
+    return None
+
+
+def avito_url_from_response(response):
+    """Ссылка на активное объявление из ответа core/v1 или None."""
+    # 404 — объявления больше нет, это окончательный ответ
+    if check_avito_response(response, (200, 404)).status_code == 404:
         return None
+    data = response.json()
+    if data.get('status') == "active":
+        return data.get('url')
+    return None
+
+
+def avito_stats_from_response(response):
+    """Контакты, избранное и просмотры из ответа stats/v1."""
+    # Извлекаем значения статистики из JSON
+    data = check_avito_response(response).json()
+    stats_items = data.get("result", {}).get("items", [])
+    if not stats_items:
+        return None, None, None  # Если статистика не найдена
+    stats = stats_items[0].get("stats", [])[0]
+    return (stats.get("uniqContacts"), stats.get("uniqFavorites"),
+            stats.get("uniqViews"))
+
+
+def format_avito_message(url, contacts, favorites, views):
+    """Текст ответа по опубликованному объявлению Авито."""
+    return (f"{GREEN_CHECKMARK} Статистика по объекту за месяц: \n"
+            f"{PHONE} Запросили контакт: {contacts}\n"
+            f"{HEART} Добавили в избранное: {favorites}\n"
+            f"{MAGNIFYING_GLASS} Просмотров карточки: {views}\n"
+            f"{GREEN_CHECKMARK} Ваше объявление на Avito успешно \n"
+            f"публикуется: {url}")
+
+
+def get_id_avito(lookup: LookupResult):
+    """Получение id объекта авито по листингу."""
+    url = f'{URL_GET_AVITO_ID_LISTING}{lookup.listing_id}'
+    lookup.avito_id = avito_id_from_response(avito_request('GET', url))
 
 
-def get_avito_stats():
-    """Получение статистики по объекту на авито."""
-    global global_token
-    global global_id_avito
-    headers = {'Authorization': f'Bearer {global_token}'}
-    current_date = datetime.now()
-    date_from = current_date - timedelta(days=30)
+def get_item_avito_status(avito_id):
+    """Получаение статуса на авито."""
+    url = f'{URL_GET_AVITO_URL}{avito_id}/'
+    return avito_url_from_response(avito_request('GET', url))
+
+
+def chunked(items, size):
+    """Разбиение списка на части не длиннее size."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
 
-    request_body = {
+
+def avito_stats_request_body(item_ids, days=30, period_grouping="month"):
+    """Тело запроса статистики авито за последние days дней."""
+    current_date = datetime.now()
+    date_from = current_date - timedelta(days=days)
+    return {
         "dateFrom": date_from.strftime('%Y-%m-%d'),
         "dateTo": current_date.strftime('%Y-%m-%d'),
         "fields": [
@@ -140,241 +508,1284 @@ def get_avito_stats():
             "uniqContacts",
             "uniqFavorites"
         ],
-        "itemIds": [
-            global_id_avito
-        ],
-        "periodGrouping": "month"
+        "itemIds": item_ids,
+        "periodGrouping": period_grouping
     }
 
-    response = requests.post(
-        URL_GET_AVITO_STATS, json=request_body, headers=headers)
 
-    if response.status_code == 200:
-        data = response.json()
-        # Извлекаем значения статистики из JSON
-        stats_items = data.get("result", {}).get("items", [])
-        if stats_items:
-            stats = stats_items[0].get("stats", [])[0]
-            uniq_contacts = stats.get("uniqContacts")
-            uniq_favorites = stats.get("uniqFavorites")
-            uniq_views = stats.get("uniqViews")
-
-            # Возвращаем полученные значения
-            return uniq_contacts, uniq_favorites, uniq_views
-        else:
-            return None, None, None  # Если статистика не найдена
+def get_avito_stats(avito_id):
+    """Получение статистики по объекту на авито."""
+    request_body = avito_stats_request_body([avito_id])
+    return avito_stats_from_response(
+        avito_request('POST', URL_GET_AVITO_STATS, json=request_body))
+
+
+def get_avito_ids(listing_ids):
+    """Id объявлений авито по листингам, пачками через один запрос."""
+    avito_ids = {}
+    for chunk in chunked(listing_ids, AVITO_IDS_BATCH_SIZE):
+        response = avito_request(
+            'GET', f'{URL_GET_AVITO_ID_LISTING}{",".join(chunk)}')
+        if response is None or response.status_code != 200:
+            raise RuntimeError(
+                f"Ошибка запроса id Авито: "
+                f"{getattr(response, 'status_code', 'нет токена')}")
+        for item in response.json().get('items') or []:
+            if item.get('avito_id'):
+                avito_ids[str(item.get('ad_id'))] = item['avito_id']
+    return avito_ids
+
+
+def get_avito_active_items():
+    """Ссылки всех активных объявлений компании по id авито."""
+    active_items = {}
+    page = 1
+    while True:
+        params = {
+            'per_page': AVITO_ITEMS_PAGE_SIZE,
+            'page': page,
+            'status': 'active',
+        }
+        response = avito_request('GET', URL_GET_AVITO_ITEMS, params=params)
+        if response is None or response.status_code != 200:
+            raise RuntimeError(
+                f"Ошибка запроса объявлений Авито: "
+                f"{getattr(response, 'status_code', 'нет токена')}")
+        resources = response.json().get('resources') or []
+        for item in resources:
+            active_items[item.get('id')] = item.get('url')
+        if len(resources) < AVITO_ITEMS_PAGE_SIZE:
+            return active_items
+        page += 1
+
+
+def get_avito_stats_batch(avito_ids, days=30, period_grouping="month",
+                          pause=0):
+    """Статистика по многим объявлениям: {id авито: список периодов}.
+
+    pause — пауза между пачками, чтобы не упираться в лимиты API.
+    """
+    stats = {}
+    for number, chunk in enumerate(chunked(avito_ids, AVITO_STATS_BATCH_SIZE)):
+        if number and pause:
+            time.sleep(pause)
+        request_body = avito_stats_request_body(chunk, days, period_grouping)
+        response = avito_request(
+            'POST', URL_GET_AVITO_STATS, json=request_body)
+        if response is None or response.status_code != 200:
+            raise RuntimeError(
+                f"Ошибка запроса статистики Авито: "
+                f"{getattr(response, 'status_code', 'нет токена')}")
+        for item in response.json().get("result", {}).get("items", []):
+            stats[item.get("itemId")] = item.get("stats", [])
+    return stats
+
+
+def load_avito_items(listing_ids):
+    """Объявления авито по листингам: id, ссылка и статистика за месяц.
+
+    Ссылка есть только у активных объявлений. Для небольшого числа
+    объявлений она запрашивается по каждому, иначе — одним обходом
+    активных объявлений компании.
+    """
+    avito_ids = get_avito_ids(listing_ids)
+    if len(avito_ids) <= AVITO_ITEM_LOOKUP_LIMIT:
+        active_items = {
+            avito_id: get_item_avito_status(avito_id)
+            for avito_id in avito_ids.values()
+        }
     else:
-        logging.warning(
-            "Ошибка при выполнении запроса на стороне Авито. Код ответа: %s",
-            response.status_code)
-        return None, None, None
+        active_items = get_avito_active_items()
+    stats = get_avito_stats_batch(list(avito_ids.values()))
+    items = {}
+    for listing_id, avito_id in avito_ids.items():
+        periods = stats.get(avito_id) or [{}]
+        items[listing_id] = {
+            "avito_id": avito_id,
+            "url": active_items.get(avito_id),
+            "contacts": periods[0].get("uniqContacts"),
+            "favorites": periods[0].get("uniqFavorites"),
+            "views": periods[0].get("uniqViews"),
+        }
+    return items
+
+
+def load_avito_daily_stats(avito_ids, days):
+    """Посуточная статистика объявлений за последние days дней.
+
+    Запрашиваются только объявления, которых нет в кэше хотя бы за один
+    день, пачками с разбивкой по дням. Возвращает {день: {id авито:
+    (просмотры, контакты, избранное)}}.
+    """
+    today = date.today()
+    period = [
+        (today - timedelta(days=offset)).isoformat()
+        for offset in range(days)
+    ]
+    missing = avito_daily_stats.missing(period, avito_ids)
+    if missing:
+        stats = get_avito_stats_batch(
+            sorted(set().union(*missing.values())),
+            days=(today - date.fromisoformat(min(missing))).days,
+            period_grouping="day", pause=AVITO_STATS_BATCH_PAUSE)
+        by_day = {}
+        for avito_id, periods in stats.items():
+            for period_stats in periods:
+                by_day.setdefault(period_stats.get("date"), {})[avito_id] = (
+                    period_stats.get("uniqViews", 0),
+                    period_stats.get("uniqContacts", 0),
+                    period_stats.get("uniqFavorites", 0),
+                )
+        for day, day_items in missing.items():
+            day_stats = by_day.get(day, {})
+            avito_daily_stats.put(
+                day, day_items,
+                {avito_id: day_stats[avito_id] for avito_id in day_items
+                 if avito_id in day_stats},
+                complete=day < today.isoformat())
+    return {day: avito_daily_stats.get(day) for day in period}
+
+
+def sum_stats(values):
+    """Поэлементная сумма кортежей (просмотры, контакты, избранное)."""
+    return tuple(map(sum, zip((0, 0, 0), *values)))
+
+
+def format_portfolio_item(position, url, values):
+    return (f"{position}. {url} — {MAGNIFYING_GLASS} {values[0]} "
+            f"{PHONE} {values[1]} {HEART} {values[2]}")
+
+
+def format_portfolio(items, daily, top):
+    """Сводка по всем объявлениям: итоги, дни и рейтинг по просмотрам."""
+    totals = {
+        avito_id: sum_stats(
+            day_stats[avito_id] for day_stats in daily.values()
+            if avito_id in day_stats)
+        for avito_id in items
+    }
+    views, contacts, favorites = sum_stats(totals.values())
+    lines = [
+        f"Статистика Авито за {len(daily)} дн., "
+        f"активных объявлений: {len(items)}",
+        f"{MAGNIFYING_GLASS} Просмотров: {views}",
+        f"{PHONE} Запросили контакт: {contacts}",
+        f"{HEART} Добавили в избранное: {favorites}",
+        "",
+        "По дням:",
+    ]
+    for day in sorted(daily):
+        day_views, day_contacts, day_favorites = sum_stats(
+            values for avito_id, values in daily[day].items()
+            if avito_id in items)
+        lines.append(
+            f"{date.fromisoformat(day).strftime('%d.%m')}: "
+            f"{MAGNIFYING_GLASS} {day_views} {PHONE} {day_contacts} "
+            f"{HEART} {day_favorites}")
+
+    ranking = sorted(totals, key=lambda avito_id: totals[avito_id][0])
+    lines.extend(["", "Больше всего просмотров:"])
+    lines.extend(
+        format_portfolio_item(position, items[avito_id], totals[avito_id])
+        for position, avito_id in enumerate(ranking[::-1][:top], 1))
+    lines.extend(["", "Меньше всего просмотров:"])
+    lines.extend(
+        format_portfolio_item(position, items[avito_id], totals[avito_id])
+        for position, avito_id in enumerate(ranking[:top], 1))
+    return lines
+
+
+def parse_portfolio_args(args):
+    """Период в днях и размер рейтинга из аргументов /portfolio."""
+    values = list(args) + [
+        str(PORTFOLIO_DEFAULT_DAYS), str(PORTFOLIO_DEFAULT_TOP)][len(args):]
+    if len(values) != 2 or not all(value.isdigit() for value in values):
+        return None
+    days, top = map(int, values)
+    if not (1 <= days <= PORTFOLIO_MAX_DAYS and 1 <= top <= PORTFOLIO_MAX_TOP):
+        return None
+    return days, top
 
 
-def handle_avito_input(
-        update: Update, context: CallbackContext, user_input: str):
+def handle_avito_input(lookup: LookupResult):
     """Получени ссылки с Авито."""
-    global global_token
+    with platform_call('Avito'):
+        get_id_avito(lookup)
+        if not lookup.avito_id:
+            return [f"{RED_CROSS} Объявление на Avito не найдено."]
+        contacts, favorites, views = get_avito_stats(lookup.avito_id)
+        url = get_item_avito_status(lookup.avito_id)
+    if url:
+        return [format_avito_message(url, contacts, favorites, views)]
+    return []
+
+
+def get_cian_headers():
+    return {'Authorization': f'Bearer {TOKEN_CIAN}'}
+
+
+def make_cian_entry(offer):
+    """Данные объявления ЦИАН: статус, ссылка и ошибки."""
+    return {
+        "status": offer.get("status"),
+        "url": offer.get("url"),
+        "errors": offer.get("errors"),
+    }
 
-    if global_token is None:
-        if not get_new_token():
-            send_message(
-                update, context,
-                "Не удалось получить токен Avito. Попробуйте позже.")
-            return
 
-    get_id_avito(user_input)
-    if global_id_avito:
-        contacts, favorites, views = get_avito_stats()
-        url = get_item_avito_status(global_id_avito)
-        if url:
-            send_message(
-                update, context,
-                f"{GREEN_CHECKMARK} Статистика по объекту за месяц: \n"
-                f"{PHONE} Запросили контакт: {contacts}\n"
-                f"{HEART} Добавили в избранное: {favorites}\n"
-                f"{MAGNIFYING_GLASS} Просмотров карточки: {views}\n"
-                f"{GREEN_CHECKMARK} Ваше объявление на Avito успешно \n"
-                f"публикуется: {url}")
-    else:
-        send_message(
-            update, context, f"{RED_CROSS} Объявление на Avito не найдено.")
-
-
-def handle_cian_input(
-        update: Update, context: CallbackContext, user_input: str):
-    """Получени ссылки с Циан."""
-    cian_headers = {'Authorization': f'Bearer {TOKEN_CIAN}'}
-    cian_params = {"externalId": user_input}
-
-    response_cian = requests.get(
-        URL_GET_CIAN_FEED, headers=cian_headers, params=cian_params)
-    data = response_cian.json()
-
-    if (response_cian.status_code == 200 and
-            "result" in data and "offers" in data["result"]):
-        offers = data["result"]["offers"]
-        found_cian_offer = False
-
-        for offer in offers:
-            if offer["externalId"] == user_input:
-                found_cian_offer = True
-                if offer["status"] == "Published":
-                    url = offer["url"]
-                    send_message(
-                        update, context,
-                        f"{GREEN_CHECKMARK} Ваше объявление на CIAN успешно "
-                        f"публикуется: {url}")
-                else:
-                    error = offer.get("errors", "Неизвестная ошибка.")
-                    send_message(
-                        update, context, f"Есть ошибка на CIAN: {error}")
-        if not found_cian_offer:
-            send_message(
-                update, context, f"{RED_CROSS} Объект не найден ЦИАН!")
-    else:
-        logging.warning(
-            "Ошибка при выполнении запроса на стороне Циан. Код ответа: %s",
-            response_cian.status_code)
+def format_cian_entry(entry):
+    """Текст ответа по объявлению ЦИАН."""
+    if entry["status"] == "Published":
+        return (f"{GREEN_CHECKMARK} Ваше объявление на CIAN успешно "
+                f"публикуется: {entry['url']}")
+    return f"Есть ошибка на CIAN: {entry['errors'] or 'Неизвестная ошибка.'}"
 
 
-def process_yandex_response(response_yandex, user_input, update, context):
-    global global_found_ya_offer
-    try:
-        data = response_yandex.json()
-        listing_snippets = data.get("listing", {}).get("snippets", [])
+def find_cian_entries(data, listing_id):
+    """Объявления листинга в ответе get-order."""
+    offers = data.get("result", {}).get("offers", [])
+    return [
+        make_cian_entry(offer) for offer in offers
+        if offer.get("externalId") == listing_id
+    ]
 
-        for snippet in listing_snippets:
-            offer = snippet.get("offer", {})
-            internal_id = offer.get("internalId")
-
-            if internal_id == user_input and not offer.get("state"):
-                global_found_ya_offer = True
-                url = offer.get("url")
-                send_message(
-                    update, context,
-                    f"{GREEN_CHECKMARK} Ваше объявление "
-                    f"на Яндекс успешно публикуется: {url}")
-
-            elif internal_id == user_input and offer.get("state"):
-                state_errors = offer.get("state")
-                get_errors = state_errors.get("errors")
-                errors_list = []
-                global_found_ya_offer = True
-
-                for error in get_errors:
-                    error_type = error["type"]
-                    if ya_error_lib.get(error_type):
-                        error_text = ya_error_lib[error_type]
-                        errors_list.append(error_text)
-                    else:
-                        new_error = 'Неизвестная ошибка'
-                        errors_list.append(new_error)
-
-                send_message(
-                    update, context,
-                    f"{RED_CROSS} Объект не публикуется на Яндекс! \n"
-                    f"Причина: {', '.join(errors_list)}"
-                )
-    except ValueError:
-        send_message(update, context, "Некорректный JSON-ответ от эндпоинта.")
+
+def log_cian_error(response_cian):
+    logging.warning(
+        "Ошибка при выполнении запроса на стороне Циан. Код ответа: %s",
+        response_cian.status_code)
+
+
+def get_cian_replies(response_cian, listing_id):
+    """Ответы по листингу из ответа get-order."""
+    if response_cian.status_code != 200:
+        log_cian_error(response_cian)
+        raise PlatformError(f"Код ответа Циан: {response_cian.status_code}")
+    return format_cian_replies(
+        find_cian_entries(response_cian.json(), listing_id))
+
+
+def format_cian_replies(entries):
+    """Ответы ЦИАН по всем объявлениям листинга (None — не найдено)."""
+    if not entries:
+        return [f"{RED_CROSS} Объект не найден ЦИАН!"]
+    return [format_cian_entry(entry) for entry in entries]
+
+
+def get_cian_index_replies(listing_id):
+    """Ответы ЦИАН по индексу заказа."""
+    return format_cian_replies(cian_index.get(listing_id))
+
+
+def handle_cian_input(lookup: LookupResult):
+    """Получени ссылки с Циан.
+
+    Со свежим индексом заказа ответ не требует запросов к API; иначе
+    индекс обновляется в фоне, а листинг запрашивается отдельно.
+    """
+    if cian_index.is_fresh() and not lookup.refresh:
+        return get_cian_index_replies(lookup.listing_id)
+    if CIAN_INDEX_REFRESH:
+        cian_index.refresh_in_background()
+
+    cian_params = {"externalId": lookup.listing_id}
+    with platform_call('CIAN'):
+        response_cian = cian_session.get(
+            URL_GET_CIAN_FEED, headers=get_cian_headers(),
+            params=cian_params)
+        return get_cian_replies(response_cian, lookup.listing_id)
 
 
-def handle_yandex_input(
-        update: Update, context: CallbackContext, user_input: str):
-    """Получение ссылки с Яндекс."""
-    yandex_headers = {
+# Валидаторы последнего заказа для условного запроса (ETag/Last-Modified)
+cian_order_validators = {}
+
+
+def load_cian_offers():
+    """Все объявления заказа ЦИАН: {externalId: список объявлений}.
+
+    У одного листинга в заказе может быть несколько объявлений. В индексе
+    остаются только статус, ссылка и ошибки объявления.
+    Возвращает None, если заказ не изменился с прошлой загрузки.
+    """
+    cian_headers = get_cian_headers()
+    if 'ETag' in cian_order_validators:
+        cian_headers['If-None-Match'] = cian_order_validators['ETag']
+    if 'Last-Modified' in cian_order_validators:
+        cian_headers['If-Modified-Since'] = (
+            cian_order_validators['Last-Modified'])
+
+    response_cian = cian_session.get(URL_GET_CIAN_FEED, headers=cian_headers)
+    if response_cian.status_code == 304:
+        return None
+    if response_cian.status_code != 200:
+        raise RuntimeError(f"Код ответа Циан: {response_cian.status_code}")
+    offers = response_cian.json().get("result", {}).get("offers", [])
+    for header in ('ETag', 'Last-Modified'):
+        if header in response_cian.headers:
+            cian_order_validators[header] = response_cian.headers[header]
+    entries = {}
+    for offer in offers:
+        entries.setdefault(offer.get("externalId"), []).append(
+            make_cian_entry(offer))
+    return entries
+
+
+cian_index = OfferIndex(
+    'CIAN', load_cian_offers, CIAN_INDEX_TTL)
+
+
+@in_background
+def refresh_cian_index(context: CallbackContext):
+    """Плановое обновление индекса ЦИАН."""
+    cian_index.refresh()
+
+
+def get_yandex_headers():
+    return {
         'Authorization': f'OAuth {YANDEX_TOKEN}',
         'X-Authorization': f'Vertis {YANDEX_X_TOKEN}'
     }
+
+
+def make_yandex_entry(offer):
+    """Данные объявления Яндекса для индекса: ссылка и коды ошибок."""
+    state = offer.get("state") or {}
+    return {
+        "url": offer.get("url"),
+        "errors": [error["type"] for error in state.get("errors") or []],
+    }
+
+
+def format_yandex_entry(entry):
+    """Текст ответа по объявлению Яндекса."""
+    if not entry["errors"]:
+        return (f"{GREEN_CHECKMARK} Ваше объявление "
+                f"на Яндекс успешно публикуется: {entry['url']}")
+    errors_list = describe_errors(tuple(entry["errors"]))
+    if len(errors_list) == 1:
+        return (f"{RED_CROSS} Объект не публикуется на Яндекс! \n"
+                f"Причина: {errors_list[0]}")
+    return (f"{RED_CROSS} Объект не публикуется на Яндекс! \n"
+            f"Причины ({len(errors_list)}):\n" +
+            "\n".join(f"— {error}" for error in errors_list))
+
+
+def yandex_page_params(offset):
     yandex_params = {"feedId": YANDEX_FEED_ID}
-    global global_found_ya_offer
-    global_found_ya_offer = False
-
-    response_yandex = requests.get(
-        URL_GET_YANDEX_FEED, headers=yandex_headers, params=yandex_params)
-
-    if response_yandex.status_code == 200:
-        process_yandex_response(response_yandex, user_input, update, context)
-        total = response_yandex.json()['listing']['slicing']['total']
-        offset = 100
-
-        while offset < total:
-            yandex_params["offset"] = f"{offset}"
-            response_yandex = requests.get(
-                URL_GET_YANDEX_FEED,
-                headers=yandex_headers,
-                params=yandex_params
-            )
-            if response_yandex.status_code == 200:
-                process_yandex_response(
-                    response_yandex, user_input, update, context)
-            else:
-                send_message(
-                    update, context,
-                    "Ошибка при выполнении запроса на эндпоинт."
-                )
-            offset += 100
-    else:
+    if offset:
+        yandex_params["offset"] = f"{offset}"
+    return yandex_params
+
+
+def decode_yandex_page(response_yandex):
+    """Страница фида, декодированная один раз, или None при ошибке."""
+    if response_yandex.status_code != 200:
+        logging.warning(
+            "Код отличный от 200: %s", response_yandex.status_code)
+        return None
+    try:
+        return response_yandex.json()
+    except ValueError:
+        logging.warning("Некорректный JSON-ответ от эндпоинта Яндекса.")
+        return None
+
+
+def fetch_yandex_page(offset):
+    return decode_yandex_page(yandex_session.get(
+        URL_GET_YANDEX_FEED,
+        headers=get_yandex_headers(),
+        params=yandex_page_params(offset)
+    ))
+
+
+def yandex_page_offsets(page):
+    """Смещения остальных страниц фида по slicing.total первой."""
+    total = page["listing"]["slicing"]["total"]
+    return range(YANDEX_PAGE_SIZE, total, YANDEX_PAGE_SIZE)
+
+
+def load_yandex_offers():
+    """Полная выгрузка фида Яндекса в словарь по internalId."""
+    offers = {}
+    offset = 0
+    total = None
+
+    while total is None or offset < total:
+        page = fetch_yandex_page(offset)
+        if page is None:
+            raise RuntimeError(f"Ошибка загрузки страницы Яндекса {offset}")
+        listing = page.get("listing", {})
+        for snippet in listing.get("snippets", []):
+            offer = snippet.get("offer", {})
+            offers.setdefault(offer.get("internalId"), []).append(
+                make_yandex_entry(offer))
+        total = listing["slicing"]["total"]
+        offset += YANDEX_PAGE_SIZE
+    yandex_errors.update(offers)
+    return offers
+
+
+# Сводка ошибок фида по кодам, обновляется вместе с индексом
+yandex_errors = YandexErrorStats()
+yandex_index = OfferIndex(
+    'Yandex', load_yandex_offers, YANDEX_INDEX_TTL)
+
+
+@in_background
+def refresh_yandex_index(context: CallbackContext):
+    """Плановое обновление индекса Яндекса."""
+    yandex_index.refresh()
+
+
+def find_yandex_entries(data, listing_id):
+    """Объявления листинга на странице фида Яндекса."""
+    return [
+        make_yandex_entry(snippet["offer"])
+        for snippet in data.get("listing", {}).get("snippets", [])
+        if snippet.get("offer", {}).get("internalId") == listing_id
+    ]
+
+
+def format_yandex_replies(entries):
+    """Ответы Яндекса по всем объявлениям листинга (None — не найдено)."""
+    if not entries:
+        return [f"{RED_CROSS} Объект не найден на Яндекс."]
+    return [format_yandex_entry(entry) for entry in entries]
+
+
+def get_yandex_index_replies(listing_id):
+    """Ответы Яндекса по индексу фида."""
+    return format_yandex_replies(yandex_index.get(listing_id))
+
+
+def process_yandex_page(page, lookup: LookupResult, replies):
+    """Ответы по листингу со страницы фида; True, если листинг найден.
+
+    Незагруженная страница отмечается в lookup.yandex_failed.
+    """
+    if page is None:
+        lookup.yandex_failed = True
+        return False
+    entries = find_yandex_entries(page, lookup.listing_id)
+    if entries:
+        lookup.yandex_found = True
+        replies.extend(format_yandex_entry(entry) for entry in entries)
+    return bool(entries)
+
+
+def finish_yandex_scan(lookup: LookupResult, replies):
+    """Итог обхода фида.
+
+    Если листинг не найден, а часть страниц не загрузилась, ответ
+    «не найдено» не окончательный — вместо него PlatformError.
+    """
+    if not lookup.yandex_found:
+        if lookup.yandex_failed:
+            raise PlatformError(
+                "Не все страницы фида Яндекса загружены",
+                ["Ошибка при выполнении запроса на эндпоинт."])
+        replies.append(f"{RED_CROSS} Объект не найден на Яндекс.")
+    return replies
+
+
+def handle_yandex_input(lookup: LookupResult):
+    """Получение ссылки с Яндекс.
+
+    Без свежего индекса фид обходится постранично: после первой страницы
+    остальные загружаются параллельно (не больше YANDEX_PAGE_CONCURRENCY
+    одновременно), а обход прекращается, как только листинг найден.
+    """
+    if yandex_index.is_fresh() and not lookup.refresh:
+        return get_yandex_index_replies(lookup.listing_id)
+
+    # Индекс ещё не собран или устарел: обновляем его в фоне,
+    # а текущий запрос обслуживаем обходом фида.
+    if YANDEX_INDEX_REFRESH:
+        yandex_index.refresh_in_background()
+
+    with platform_call('Yandex'):
+        replies = scan_yandex_feed(lookup)
+    return replies
+
+
+def scan_yandex_feed(lookup: LookupResult):
+    """Постраничный обход фида Яндекса до первой страницы с листингом."""
+    replies = []
+    pages = 1
+    first_page = fetch_yandex_page(0)
+    if (not process_yandex_page(first_page, lookup, replies)
+            and first_page is not None):
+        futures = [
+            submit_with_context(
+                yandex_page_executor, fetch_yandex_page, offset)
+            for offset in yandex_page_offsets(first_page)
+        ]
+        try:
+            for future in as_completed(futures):
+                pages += 1
+                if process_yandex_page(future.result(), lookup, replies):
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+    metrics.observe('arka_yandex_scan_pages', pages)
+
+    return finish_yandex_scan(lookup, replies)
+
+
+def make_domclick_entry(offer):
+    """Данные объявления ДомКлик для индекса."""
+    return {
+        "status": offer.findtext('Status/Code'),
+        "url": offer.findtext('Publication/DomclickURL'),
+        "discount_status": offer.findtext('DiscountStatus/Code'),
+        "reasons": [
+            reason.findtext('Descr') for reason in
+            offer.iterfind('DiscountStatus/RejectionReasons/Reason')
+        ],
+    }
+
+
+def format_domclick_entry(entry):
+    """Текст ответа по опубликованному объявлению ДомКлик."""
+    if entry["discount_status"] == 'rejected':
+        return (f"ВНИМАНИЕ! Объект публикуется на ДомКлик, "
+                f"но нет скидки!\n"
+                f"Причина: {', '.join(entry['reasons'])}")
+    return (f"{GREEN_CHECKMARK} Объект успешно публикуется на "
+            f"Домклик: {entry['url']}")
+
+
+# Валидаторы последнего отчёта для условного запроса (ETag/Last-Modified)
+domclick_report_validators = {}
+
+
+def load_domclick_offers():
+    """Потоковый разбор отчёта ДомКлик: {ExternalId: список объявлений}.
+
+    У листинга в отчёте может быть несколько Offer. Отчёт читается
+    по мере загрузки, а обработанные Offer сразу удаляются из дерева,
+    поэтому целиком в памяти он не хранится. Возвращает None, если отчёт
+    не изменился с прошлой загрузки.
+    """
+    domclick_headers = {'Authorization': f'Token {TOKEN_DOMCLICK}'}
+    if 'ETag' in domclick_report_validators:
+        domclick_headers['If-None-Match'] = (
+            domclick_report_validators['ETag'])
+    if 'Last-Modified' in domclick_report_validators:
+        domclick_headers['If-Modified-Since'] = (
+            domclick_report_validators['Last-Modified'])
+
+    with domclick_session.get(URL_GET_DOMCLICK_REPORT,
+                              headers=domclick_headers,
+                              stream=True) as domclick_response:
+        if domclick_response.status_code == 304:
+            return None
+        if domclick_response.status_code != 200:
+            raise RuntimeError(
+                f"Код ответа ДомКлик: {domclick_response.status_code}")
+
+        domclick_response.raw.decode_content = True
+        offers = {}
+        offer_list = None
+        for event, element in ElementTree.iterparse(
+                domclick_response.raw, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == 'OfferList':
+                    offer_list = element
+            elif element.tag == 'Offer':
+                offers.setdefault(element.findtext('ExternalId'), []).append(
+                    make_domclick_entry(element))
+                if offer_list is not None:
+                    offer_list.remove(element)
+
+        for header in ('ETag', 'Last-Modified'):
+            if header in domclick_response.headers:
+                domclick_report_validators[header] = (
+                    domclick_response.headers[header])
+    return offers
+
+
+domclick_index = OfferIndex(
+    'DomClick', load_domclick_offers, DOMCLICK_INDEX_TTL)
+
+
+@in_background
+def refresh_domclick_index(context: CallbackContext):
+    """Плановое обновление индекса ДомКлик."""
+    domclick_index.refresh()
+
+
+def format_domclick_replies(entries):
+    """Ответы ДомКлик по опубликованным объявлениям листинга.
+
+    None или ни одного опубликованного — не найдено.
+    """
+    replies = [
+        format_domclick_entry(entry) for entry in entries or []
+        if entry["status"] == 'published'
+    ]
+    return replies or [f"{RED_CROSS} Объект не найден ДомКлик!"]
+
+
+def get_domclick_replies(listing_id, force_refresh=False):
+    """Ответы ДомКлик по индексу, при необходимости обновив его.
+
+    Автомат площадки проверяется только при загрузке отчёта. Если отчёт
+    не обновился, ответ по прошлой загрузке приходит в PlatformError,
+    чтобы не попасть в кэш.
+    """
+    if force_refresh or not domclick_index.is_fresh():
+        with platform_call('DomClick'):
+            refresh_domclick_report(listing_id)
+
+    return format_domclick_replies(domclick_index.get(listing_id))
+
+
+def refresh_domclick_report(listing_id):
+    """Обновление отчёта ДомКлик; PlatformError, если он не загрузился."""
+    if not domclick_index.refresh():
+        if not domclick_index.is_ready():
+            raise PlatformError(
+                f"Отчёт ДомКлик не загружен: {domclick_index.last_error}",
+                [f"Системная ошибка на стороне ДомКлик. \n"
+                 f"Держите ответ: {domclick_index.last_error} \n"
+                 f"Он вряд ли вам что-то скажет, но пусть будет."])
         logging.warning(
-            "Код отличный от 200: %s",
-            response_yandex.status_code)
+            "Отчёт ДомКлик устарел, ответ по последней загрузке: %s",
+            listing_id)
+        raise PlatformError(
+            "Отчёт ДомКлик устарел",
+            format_domclick_replies(domclick_index.get(listing_id)))
+
+
+def handle_domclick_input(lookup: LookupResult):
+    """Получени ссылки с ДомКлик."""
+    return get_domclick_replies(lookup.listing_id, lookup.refresh)
+
+
+def get_cian_cells(listing_ids):
+    """Статусы для таблицы. ЦИАН: ответ по индексу заказа."""
+    offers = load_index_entries(cian_index)
+    cells = {}
+    for listing_id in listing_ids:
+        entries = offers.get(listing_id)
+        if not entries:
+            cells[listing_id] = MINUS_SIGN
+        elif all(entry["status"] == "Published" for entry in entries):
+            cells[listing_id] = GREEN_CHECKMARK
+        else:
+            cells[listing_id] = RED_CROSS
+    return cells
+
+
+def get_yandex_cells(listing_ids):
+    """Статусы для таблицы. Яндекс: ответ по индексу фида."""
+    if not yandex_index.is_fresh() and not yandex_index.refresh():
+        raise RuntimeError(yandex_index.last_error)
+    cells = {}
+    for listing_id in listing_ids:
+        entries = yandex_index.get(listing_id)
+        if not entries:
+            cells[listing_id] = MINUS_SIGN
+        elif any(entry["errors"] for entry in entries):
+            cells[listing_id] = RED_CROSS
+        else:
+            cells[listing_id] = GREEN_CHECKMARK
+    return cells
+
+
+def get_avito_cells(listing_ids):
+    """Статусы для таблицы. Авито: пачки id, объявлений и статистики."""
+    items = load_avito_items(listing_ids)
+    cells = {}
+    for listing_id in listing_ids:
+        entry = items.get(listing_id)
+        if entry is None:
+            cells[listing_id] = MINUS_SIGN
+        elif not entry["url"]:
+            cells[listing_id] = RED_CROSS
+        else:
+            cells[listing_id] = f"{GREEN_CHECKMARK} {entry['views'] or 0}"
+    return cells
+
+
+def get_domclick_cells(listing_ids):
+    """Статусы для таблицы. ДомКлик: ответ по индексу отчёта."""
+    if not domclick_index.is_fresh() and not domclick_index.refresh():
+        raise RuntimeError(domclick_index.last_error)
+    cells = {}
+    for listing_id in listing_ids:
+        entries = domclick_index.get(listing_id) or []
+        published = [
+            entry for entry in entries if entry["status"] == 'published']
+        if not entries:
+            cells[listing_id] = MINUS_SIGN
+        elif not published:
+            cells[listing_id] = RED_CROSS
+        elif any(entry["discount_status"] == 'rejected'
+                 for entry in published):
+            cells[listing_id] = WARNING_SIGN
+        else:
+            cells[listing_id] = GREEN_CHECKMARK
+    return cells
+
+
+def format_batch_table(listing_ids, cells):
+    """Сводная таблица пакетной проверки построчно."""
+    platforms = [platform for platform, _ in get_batch_collectors()]
+    lines = [
+        "Листинг | " + " | ".join(platforms),
+    ]
+    for listing_id in listing_ids:
+        row = [
+            cells[platform].get(listing_id, QUESTION_MARK)
+            for platform in platforms
+        ]
+        lines.append(f"{listing_id} | " + " | ".join(row))
+    lines.append(
+        f"\n{GREEN_CHECKMARK} публикуется (у Avito — просмотры за месяц), "
+        f"{WARNING_SIGN} без скидки, {RED_CROSS} не публикуется, "
+        f"{MINUS_SIGN} не найден, {QUESTION_MARK} площадка не ответила")
+    return lines
+
+
+def get_batch_collectors():
+    """Пакетные обработчики площадок: один запрос на все листинги."""
+    return (
+        ('CIAN', get_cian_cells),
+        ('Yandex', get_yandex_cells),
+        ('Avito', get_avito_cells),
+        ('DomClick', get_domclick_cells),
+    )
+
+
+def run_batch_lookup(update: Update, context: CallbackContext, listing_ids):
+    """Проверка многих листингов со сводной таблицей в ответе."""
+    started = time.monotonic()
+    futures = [
+        (platform, submit_with_context(
+            platform_executor, collector, listing_ids))
+        for platform, collector in get_batch_collectors()
+    ]
+    cells = {}
+    for platform, future, remaining in iter_platform_futures(
+            futures, started):
+        try:
+            cells[platform] = future.result(timeout=remaining)
+        except TimeoutError:
+            metrics.inc(
+                'arka_platform_failures_total', platform=platform,
+                reason='timeout')
+            logging.warning(
+                "%s не ответил за %s с при пакетной проверке",
+                platform, PLATFORM_TIMEOUTS[platform])
+            cells[platform] = {}
+        except Exception as error:
+            metrics.inc(
+                'arka_platform_failures_total', platform=platform,
+                reason='error')
+            logging.error(
+                "Ошибка при пакетной обработке %s: %s", platform, str(error))
+            cells[platform] = {}
+    send_long_message(
+        update, context, format_batch_table(listing_ids, cells))
+
+
+def parse_listing_ids(text: str):
+    """Номера листингов из текста без повторов, в порядке ввода."""
+    return list(dict.fromkeys(re.split(r'[\s,;]+', text.strip())))
+
+
+def handle_batch_input(update: Update, context: CallbackContext, text: str):
+    """Пакетная проверка листингов из текста сообщения."""
+    listing_ids = [item for item in parse_listing_ids(text) if item]
+    invalid_ids = [
+        item for item in listing_ids if not is_valid_user_input(item)]
+    if not listing_ids or invalid_ids:
         send_message(
-            update, context, "Ошибка при выполнении запроса на эндпоинт.")
-    if not global_found_ya_offer:
+            update, context,
+            "Введите номера листингов по 5 цифр через пробел или "
+            "с новой строки." +
+            (f"\nНекорректные: {', '.join(invalid_ids)}"
+             if invalid_ids else ""))
+    elif len(listing_ids) > BATCH_MAX_LISTINGS:
         send_message(
             update, context,
-            f"{RED_CROSS} Объект не найден на Яндекс."
-        )
-        global_found_ya_offer = False
+            f"За один раз можно проверить не больше "
+            f"{BATCH_MAX_LISTINGS} листингов.")
+    else:
+        run_batch_lookup(update, context, listing_ids)
 
 
-def handle_domclick_input(
-        update: Update, context: CallbackContext, user_input: str):
-    """Получени ссылки с ДомКлик."""
-    domclick_headers = {'Authorization': f'Token {TOKEN_DOMCLICK}'}
+def handle_check_command(update: Update, context: CallbackContext):
+    """Команда /check: пакетная проверка листингов."""
+    text = " ".join(context.args)
+    with lookup_trace():
+        logging.info("Пакетная проверка: %s", text)
+        handle_batch_input(update, context, text)
+
+
+# Локальная база (SYNC_DB_PATH): снимки всех площадок обновляются по
+# расписанию, и проверки листингов отвечают из неё без запросов к API.
+
+def load_index_entries(index):
+    """Объявления индекса, обновлённого при необходимости."""
+    return load_index_snapshot(index)[0]
+
+
+def load_index_snapshot(index):
+    """Объявления индекса и время его загрузки с площадки."""
+    if not index.is_fresh() and not index.refresh():
+        raise RuntimeError(index.last_error)
+    # Время читается до объявлений: при обновлении между ними снимок
+    # окажется новее отметки, но не старше
+    refreshed_at = index.refreshed_at
+    return dict(index.entries), refreshed_at
+
+
+def load_avito_portfolio():
+    """Объявления авито по всем листингам из фидов остальных площадок.
+
+    Листинга, которого нет в других фидах, в снимке тоже нет: такие
+    листинги проверяются на Авито напрямую.
+    """
+    synced_at = time.time()
+    listing_ids = set()
+    for platform in ('CIAN', 'Yandex', 'DomClick'):
+        listing_ids |= listing_store.listing_ids(platform)
+    return load_avito_items(sorted(listing_ids)), synced_at
+
+
+def get_sync_loaders():
+    """Загрузчики снимков площадок; Авито последним, по их листингам.
+
+    Загрузчик возвращает объявления и время, на которое они актуальны.
+    """
+    return (
+        ('CIAN', lambda: load_index_snapshot(cian_index)),
+        ('Yandex', lambda: load_index_snapshot(yandex_index)),
+        ('DomClick', lambda: load_index_snapshot(domclick_index)),
+        ('Avito', load_avito_portfolio),
+    )
+
+
+def sync_platform(platform, loader):
+    """Замена снимка площадки в локальной базе."""
+    started = time.monotonic()
+    try:
+        entries, synced_at = loader()
+    except Exception as error:
+        logging.error(
+            "Не удалось синхронизировать %s: %s", platform, str(error))
+        return
+    listing_store.replace_platform(platform, entries, synced_at)
+    logging.info(
+        "%s синхронизирован: %s объявлений за %.1f с",
+        platform, len(entries), time.monotonic() - started)
+
+
+@in_background
+def sync_platforms(context: CallbackContext):
+    """Плановая синхронизация всех площадок в локальную базу."""
+    for platform, loader in get_sync_loaders():
+        sync_platform(platform, loader)
+
+
+def load_saved_index(name):
+    """Самый свежий сохранённый снимок индекса: (время, объявления).
+
+    Снимок берётся из постоянного кэша или из локальной базы; None, если
+    нет ни того, ни другого.
+    """
+    snapshots = []
+    saved = cache_store.get_cached(f'index:{name}') if cache_store else None
+    if saved is not None:
+        snapshots.append((saved['refreshed_at'], saved['entries']))
+    synced_at = listing_store.synced_at(name) if listing_store else None
+    if synced_at is not None:
+        snapshots.append((synced_at, {
+            listing_id: normalize_stored_entry(name, entry)
+            for listing_id, entry in listing_store.entries(name).items()
+        }))
+    return max(snapshots, key=lambda item: item[0]) if snapshots else None
+
+
+def warm_caches():
+    """Индексы площадок и кэш ответов с диска после запуска.
+
+    Индексы берутся из постоянного кэша или последних снимков
+    синхронизации и обновляются плановыми заданиями сразу после старта.
+    """
+    for index in (cian_index, yandex_index, domclick_index):
+        saved = load_saved_index(index.name)
+        if saved is not None:
+            saved_at, entries = saved
+            index.warm(entries, saved_at)
+    if yandex_index.is_ready():
+        yandex_errors.update(yandex_index.entries)
+    if cache_store is not None:
+        result_cache.restore(
+            (tuple(key), created_at, result)
+            for key, created_at, result in
+            cache_store.get_cached('results') or [])
+
+
+def save_caches():
+    """Сохранение индексов и живых ответов площадок перед остановкой."""
+    for index in (cian_index, yandex_index, domclick_index):
+        if index.is_ready():
+            cache_store.put_cached(
+                f'index:{index.name}',
+                {'refreshed_at': index.refreshed_at,
+                 'entries': index.entries},
+                index.refreshed_at + SAVED_INDEX_MAX_AGE)
+    cache_store.put_cached(
+        'results', result_cache.items(), time.time() + RESULT_CACHE_TTL)
+
+
+def format_stored_avito(entry):
+    if entry is None:
+        return [f"{RED_CROSS} Объявление на Avito не найдено."]
+    if entry["url"]:
+        return [format_avito_message(
+            entry["url"], entry["contacts"], entry["favorites"],
+            entry["views"])]
+    return []
+
+
+def get_stored_formatters():
+    """Ответы площадок по данным объявления из локальной базы."""
+    return {
+        'CIAN': format_cian_replies,
+        'Yandex': format_yandex_replies,
+        'Avito': format_stored_avito,
+        'DomClick': format_domclick_replies,
+    }
+
+
+def get_stored_entry(platform, listing_id):
+    """Данные листинга из снимка локальной базы."""
+    return normalize_stored_entry(
+        platform, listing_store.get(platform, listing_id))
+
+
+def normalize_stored_entry(platform, entry):
+    """У ЦИАН, Яндекса и ДомКлик на листинг приходится список объявлений.
+
+    Снимки, сохранённые до этого, хранят одно объявление.
+    """
+    if (platform in ('CIAN', 'Yandex', 'DomClick')
+            and isinstance(entry, dict)):
+        return [entry]
+    return entry
+
+
+# Снимок Авито собирается только по листингам остальных фидов, поэтому
+# отсутствие в нём листинга ещё не значит, что объявления нет
+PARTIAL_SNAPSHOTS = ('Avito',)
+
+
+def get_store_synced_at(platform):
+    """Время синхронизации площадки, если снимок не старше SYNC_MAX_AGE."""
+    if listing_store is None:
+        return None
+    synced_at = listing_store.synced_at(platform)
+    if synced_at is None or time.time() - synced_at > SYNC_MAX_AGE:
+        return None
+    return synced_at
+
+
+def get_stored_replies(platform, listing_id):
+    """Ответы площадки из локальной базы.
+
+    Возвращает None, если база выключена, снимок площадки устарел или
+    неполный снимок не содержит листинга: тогда площадка опрашивается
+    напрямую.
+    """
+    synced_at = get_store_synced_at(platform)
+    if synced_at is None:
+        return None
+    entry = get_stored_entry(platform, listing_id)
+    if entry is None and platform in PARTIAL_SNAPSHOTS:
+        return None
+    stamp = datetime.fromtimestamp(synced_at).strftime('%H:%M %d.%m')
+    return [
+        f"{reply}\n{CLOCK} Данные на {stamp}"
+        for reply in get_stored_formatters()[platform](entry)
+    ]
+
+
+# Отслеживание листингов (/watch): по каждой площадке за один проход
+# сравниваются компактные снимки всех отслеживаемых листингов.
+
+# Поля объявления, изменение которых отправляется подписчикам
+WATCH_FIELDS = {
+    'CIAN': ('status', 'url', 'errors'),
+    'Yandex': ('url', 'errors'),
+    'Avito': ('url',),
+    'DomClick': ('status', 'url', 'discount_status', 'reasons'),
+}
+
+
+def make_watch_snapshot(platform, entry):
+    """Компактный снимок объявления: только отслеживаемые поля.
+
+    Для списка объявлений листинга — снимки всех объявлений без учёта
+    их порядка.
+    """
+    if isinstance(entry, list):
+        return tuple(sorted(
+            (make_watch_snapshot(platform, item) for item in entry),
+            key=repr)) or None
+    if entry is None:
+        return None
+    snapshot = []
+    for field in WATCH_FIELDS[platform]:
+        value = entry.get(field)
+        if isinstance(value, list):
+            # Набор ошибок сравнивается без учёта порядка
+            value = tuple(sorted(str(item) for item in value))
+        snapshot.append(value)
+    return tuple(snapshot)
+
+
+def get_watch_loaders():
+    """Загрузчики объявлений площадок по списку листингов."""
+    return (
+        ('CIAN', lambda listing_ids: load_index_entries(cian_index)),
+        ('Yandex', lambda listing_ids: load_index_entries(yandex_index)),
+        ('Avito', load_avito_items),
+        ('DomClick', lambda listing_ids: load_index_entries(domclick_index)),
+    )
 
-    domclick_response = requests.get(
-        URL_GET_DOMCLICK_REPORT, headers=domclick_headers)
-
-    if domclick_response.status_code == 200:
-        xml_data = domclick_response.content
-        data_dict = xmltodict.parse(xml_data)
-        found_dom_offer = False
-
-        for offer in data_dict['Report']['OfferList']['Offer']:
-            external_id_node = offer.get('ExternalId')
-            if (external_id_node == user_input and
-                    offer['Status']['Code'] == 'published'):
-                domclick_url_node = offer['Publication']['DomclickURL']
-                discount_status = offer['DiscountStatus']['Code']
-                if discount_status == 'rejected':
-                    found_dom_offer = True
-                    reason_discount_rejection = offer['DiscountStatus']['RejectionReasons']['Reason']['Descr']
-                    send_message(
-                        update, context,
-                        f"ВНИМАНИЕ! Объект публикуется на ДомКлик, "
-                        f"но нет скидки!\n"
-                        f"Причина: {reason_discount_rejection}"
-                    )
-                else:
-                    found_dom_offer = True
-                    send_message(
-                        update, context,
-                        f"{GREEN_CHECKMARK} Объект успешно публикуется на "
-                        f"Домклик: {domclick_url_node}"
-                    )
-        if not found_dom_offer:
-            send_message(
-                update, context, f"{RED_CROSS} Объект не найден ДомКлик!")
+
+def load_watched_entries(platform, loader, listing_ids):
+    """Объявления листингов из свежего снимка локальной базы или с площадки.
+
+    Листинги, которых нет в неполном снимке, запрашиваются у площадки.
+    """
+    entries = {}
+    if get_store_synced_at(platform) is not None:
+        entries = {
+            listing_id: get_stored_entry(platform, listing_id)
+            for listing_id in listing_ids
+        }
+        if platform not in PARTIAL_SNAPSHOTS:
+            return entries
+    missing = [
+        listing_id for listing_id in listing_ids
+        if entries.get(listing_id) is None
+    ]
+    if missing:
+        loaded = loader(missing)
+        entries.update(
+            (listing_id, loaded.get(listing_id)) for listing_id in missing)
+    return entries
+
+
+def format_watch_alert(platform, listing_id, entry):
+    replies = (get_stored_formatters()[platform](entry) or
+               [f"{RED_CROSS} Объявление на {platform} не публикуется."])
+    return (f"{BELL} Изменения по листингу {listing_id} на {platform}:\n" +
+            "\n".join(replies))
+
+
+@in_background
+def check_watched_listings(context: CallbackContext):
+    """Плановая проверка отслеживаемых листингов с уведомлением чатов."""
+    listing_ids = watch_list.listing_ids()
+    if not listing_ids:
+        return
+    for platform, loader in get_watch_loaders():
+        try:
+            entries = load_watched_entries(platform, loader, listing_ids)
+        except Exception as error:
+            logging.error(
+                "Не удалось проверить изменения %s: %s", platform, str(error))
+            continue
+        snapshots = {
+            listing_id: make_watch_snapshot(platform, entry)
+            for listing_id, entry in entries.items()
+        }
+        for listing_id, chat_ids in watch_list.update(platform, snapshots):
+            logging.info("Изменения по листингу %s на %s", listing_id,
+                         platform)
+            text = format_watch_alert(platform, listing_id,
+                                      entries[listing_id])
+            for chat_id in chat_ids:
+                try:
+                    telegram_sender.send(context.bot, chat_id, text)
+                except Exception as error:
+                    logging.error(
+                        "Не удалось уведомить чат %s: %s", chat_id,
+                        str(error))
+
+
+def handle_watch_command(update: Update, context: CallbackContext):
+    """Команда /watch: подписка на изменения листинга."""
+    chat_id = update.effective_chat.id
+    user_input = " ".join(context.args).strip()
+    if not user_input and watch_list.listing_ids(chat_id):
+        send_message(
+            update, context,
+            "Отслеживаемые листинги: " +
+            ", ".join(watch_list.listing_ids(chat_id)))
+    elif not is_valid_user_input(user_input):
+        send_message(update, context, "Использование: /watch 12345")
+    elif watch_list.subscribe(chat_id, user_input):
+        logging.info("Чат %s отслеживает листинг %s", chat_id, user_input)
+        send_message(
+            update, context,
+            f"{BELL} Сообщу, если статус, ссылка или ошибки листинга "
+            f"{user_input} изменятся.")
     else:
-        logging.warning(
-            "Ошибка при выполнении запроса на стороне ДомКлик. Код ответа: %s",
-            domclick_response.status_code)
-        return send_message(
-            update, context, f"Системная ошибка на стороне ДомКлик. \n"
-            f"Держите код: {domclick_response.status_code} \n"
-            f"Он вряд ли вам что-то скажет, но пусть будет."
-        )
+        send_message(
+            update, context, f"Листинг {user_input} уже отслеживается.")
+
+
+def handle_unwatch_command(update: Update, context: CallbackContext):
+    """Команда /unwatch: отписка от изменений листинга."""
+    user_input = " ".join(context.args).strip()
+    if not is_valid_user_input(user_input):
+        send_message(update, context, "Использование: /unwatch 12345")
+    elif watch_list.unsubscribe(update.effective_chat.id, user_input):
+        send_message(
+            update, context, f"Листинг {user_input} больше не отслеживается.")
+    else:
+        send_message(
+            update, context, f"Листинг {user_input} не отслеживался.")
+
+
+def is_admin(update: Update) -> bool:
+    return not ADMIN_CHAT_IDS or update.effective_chat.id in ADMIN_CHAT_IDS
+
+
+def format_average(count, total):
+    return f"{total / count:.2f} с" if count else "—"
+
+
+def format_platform_stats(platform):
+    """Строка /stats по площадке: проверки, запросы, коды ответов."""
+    checks = metrics.summary('arka_handler_seconds', platform=platform)
+    requests_made = metrics.summary(
+        'arka_http_request_seconds', platform=platform)
+    statuses = ", ".join(
+        f"{labels['status']}: {value}" for labels, value in
+        metrics.counters('arka_http_responses_total')
+        if labels['platform'] == platform)
+    failures = ", ".join(
+        f"{labels['reason']}: {value}" for labels, value in
+        metrics.counters('arka_platform_failures_total')
+        if labels['platform'] == platform)
+    retries = metrics.counter('arka_http_retries_total', platform=platform)
+    stored = metrics.counter('arka_store_replies_total', platform=platform)
+    return (f"{platform}: проверок {checks[0]}, в среднем "
+            f"{format_average(*checks)}; запросов {requests_made[0]}, "
+            f"в среднем {format_average(*requests_made)}; "
+            f"коды: {statuses or '—'}; повторов {retries}; "
+            f"сбои: {failures or '—'}; из базы {stored}")
+
+
+def format_stats():
+    """Сводка метрик с запуска бота для команды /stats."""
+    lines = ["Статистика с запуска бота:"]
+    lines.extend(
+        format_platform_stats(platform) for platform in PLATFORM_TIMEOUTS)
+
+    lookups = result_cache.hits + result_cache.misses
+    hit_rate = result_cache.hits / lookups * 100 if lookups else 0
+    lines.append(
+        f"Кэш ответов: {result_cache.hits} из {lookups} ({hit_rate:.0f}%), "
+        f"записей {len(result_cache)}")
+    refreshed, failed = (
+        metrics.counter('arka_token_refresh_total', token='Avito',
+                        outcome=outcome)
+        for outcome in ('ok', 'error'))
+    lines.append(
+        f"Токен Авито: обновлений {refreshed}, ошибок {failed}, повторов "
+        f"после 403 {metrics.counter('arka_avito_auth_retries_total')}")
+    scans = metrics.summary('arka_yandex_scan_pages')
+    lines.append(
+        f"Обходов фида Яндекса: {scans[0]}, страниц в среднем "
+        f"{scans[1] / scans[0] if scans[0] else 0:.1f}")
+    lines.append("Очереди к площадкам (проверки/фон/отказы): " + ", ".join(
+        f"{limiter.name} {limiter.waiting[INTERACTIVE]}/"
+        f"{limiter.waiting[BACKGROUND]}/{limiter.rejected}"
+        for limiter in rate_limiters.values()))
+    lines.append(
+        f"Проверок в работе: {pending_lookups.active}, отклонено из-за "
+        f"перегрузки: {pending_lookups.rejected}")
+    lines.append("Автоматы площадок (ошибок подряд/отказов): " + ", ".join(
+        f"{breaker.name} {breaker.state} {breaker.failures}/"
+        f"{breaker.rejected}" for breaker in circuit_breakers.values()))
+    for index in (cian_index, yandex_index, domclick_index):
+        age = (f"{time.time() - index.refreshed_at:.0f} с назад"
+               if index.refreshed_at is not None else "не загружен")
+        lines.append(f"Индекс {index.name}: {len(index)} объявлений, {age}")
+    return lines
+
+
+def handle_stats_command(update: Update, context: CallbackContext):
+    """Команда /stats: задержки и ошибки площадок."""
+    if not is_admin(update):
+        send_message(update, context, "Команда доступна администраторам.")
+    else:
+        send_long_message(update, context, format_stats())
+
+
+def format_yandex_errors():
+    """Строки отчёта /errors по сводке ошибок фида Яндекса."""
+    if yandex_errors.updated_at is None:
+        return ["Фид Яндекса ещё не загружен."]
+    updated = datetime.fromtimestamp(yandex_errors.updated_at)
+    lines = [
+        f"Ошибки фида Яндекса на {updated:%d.%m.%Y %H:%M}: "
+        f"{yandex_errors.affected()} из {yandex_errors.total} объявлений"
+    ]
+    unknown = []
+    for code, description, count, examples in yandex_errors.summary():
+        line = f"{code}: {count} ({', '.join(examples)})"
+        if description is None:
+            unknown.append(line)
+        else:
+            lines.append(f"{line} — {description}")
+    if unknown:
+        lines.append("Коды, которых нет в каталоге:")
+        lines.extend(unknown)
+    return lines
+
+
+def handle_errors_command(update: Update, context: CallbackContext):
+    """Команда /errors: ошибки фида Яндекса по кодам."""
+    if not is_admin(update):
+        send_message(update, context, "Команда доступна администраторам.")
+    else:
+        send_long_message(update, context, format_yandex_errors())
+
+
+def handle_portfolio_command(update: Update, context: CallbackContext):
+    """Команда /portfolio: статистика Авито по всем объявлениям."""
+    args = parse_portfolio_args(context.args)
+    if args is None:
+        send_message(
+            update, context,
+            f"Использование: /portfolio [дней] [N], например /portfolio 30 "
+            f"10: статистика за 30 дней и 10 лучших и худших объявлений. "
+            f"Не больше {PORTFOLIO_MAX_DAYS} дней.")
+        return
+    days, top = args
+    logging.info("Статистика Авито за %s дн.", days)
+    try:
+        items = get_avito_active_items()
+        daily = load_avito_daily_stats(list(items), days)
+    except Exception as error:
+        logging.error("Ошибка статистики Авито: %s", str(error))
+        send_message(
+            update, context,
+            "Не удалось получить статистику Авито. Попробуйте позже.")
+        return
+    send_long_message(update, context, format_portfolio(items, daily, top))
 
 
 def start(update: Update, context: CallbackContext):
@@ -382,7 +1793,19 @@ def start(update: Update, context: CallbackContext):
 
 
 def send_message(update: Update, context: CallbackContext, text: str):
-    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+    return telegram_sender.send(context.bot, update.effective_chat.id, text)
+
+
+def send_long_message(update: Update, context: CallbackContext, lines):
+    """Отправка строк несколькими сообщениями в пределах лимита Telegram."""
+    text = ""
+    for line in lines:
+        if text and len(text) + len(line) + 1 > MESSAGE_MAX_LENGTH:
+            send_message(update, context, text)
+            text = ""
+        text = f"{text}\n{line}" if text else line
+    if text:
+        send_message(update, context, text)
 
 
 def is_valid_user_input(user_input: str) -> bool:
@@ -390,52 +1813,694 @@ def is_valid_user_input(user_input: str) -> bool:
     return user_input.isdigit() and len(user_input) == 5
 
 
+def get_platform_handlers():
+    """Обработчики площадок в порядке опроса."""
+    return (
+        ('CIAN', handle_cian_input),
+        ('Yandex', handle_yandex_input),
+        ('Avito', handle_avito_input),
+        ('DomClick', handle_domclick_input),
+    )
+
+
+def format_platform_busy(platform):
+    return (f"{WARNING_SIGN} {platform} сейчас перегружен запросами. "
+            f"Попробуйте позже.")
+
+
+def format_platform_timeout(platform):
+    return (f"{RED_CROSS} {platform} не ответил за "
+            f"{PLATFORM_TIMEOUTS[platform]} с. Попробуйте позже.")
+
+
+def format_platform_unavailable(platform):
+    return (f"{WARNING_SIGN} {platform} временно недоступен. "
+            f"Попробуйте позже.")
+
+
+def format_platform_error(platform):
+    return (f"{QUESTION_MARK} {platform}: не удалось проверить. "
+            f"Попробуйте позже.")
+
+
+def create_lookup_report(lookup: LookupResult):
+    return LookupReport(
+        lookup.listing_id,
+        [platform for platform, _ in get_platform_handlers()],
+        MESSAGE_MAX_LENGTH, REPORT_UPDATE_INTERVAL)
+
+
+def publish_report(update: Update, context: CallbackContext,
+                   report: LookupReport):
+    """Отправка сводного ответа или правка уже отправленного."""
+    if report.wait_time() != 0:
+        return
+    text = report.render()
+    chat_id = update.effective_chat.id
+    if report.message_id is None:
+        message = telegram_sender.send(context.bot, chat_id, text)
+        report.mark_published(text, message.message_id)
+    else:
+        telegram_sender.edit(context.bot, chat_id, report.message_id, text)
+        report.mark_published(text, report.message_id)
+
+
+def iter_platform_futures(futures, started):
+    """Задачи площадок в порядке истечения их таймаутов.
+
+    Для каждой задачи отдаёт оставшееся от её таймаута время,
+    отсчитанное от started.
+    """
+    for platform, future in sorted(
+            futures, key=lambda item: PLATFORM_TIMEOUTS[item[0]]):
+        remaining = max(
+            0, started + PLATFORM_TIMEOUTS[platform] - time.monotonic())
+        yield platform, future, remaining
+
+
+def run_platform(platform, handler, lookup: LookupResult, deadline=None):
+    """Ответы площадки из локальной базы, кэша или от обработчика.
+
+    deadline — CallDeadline, по которому ждущая проверка засчитает
+    автомату зависший вызов.
+    """
+    current_deadline.set(deadline)
+    with platform_context(platform):
+        if not lookup.refresh:
+            replies = get_stored_replies(platform, lookup.listing_id)
+            if replies is not None:
+                metrics.inc('arka_store_replies_total', platform=platform)
+                return replies
+        return result_cache.get_or_compute(
+            (platform, lookup.listing_id),
+            lambda: run_handler(platform, handler, lookup),
+            refresh=lookup.refresh)
+
+
+def run_handler(platform, handler, lookup: LookupResult):
+    """Вызов обработчика площадки с замером времени.
+
+    Автомат обработчик проверяет сам, в ветке с запросами к площадке.
+    """
+    with metrics.timer('arka_handler_seconds', platform=platform):
+        return handler(lookup)
+
+
+def log_platform_busy(platform, error):
+    metrics.inc(
+        'arka_platform_failures_total', platform=platform, reason='busy')
+    logging.warning("Проверка не дождалась очереди: %s", str(error))
+
+
+def log_platform_result(platform, started, outcome):
+    """Запись журнала с итогом и временем ответа площадки."""
+    latency_ms = round((time.monotonic() - started) * 1000, 1)
+    logging.info(
+        "%s: %s за %s мс", platform, outcome, latency_ms,
+        extra={'platform': platform, 'latency_ms': latency_ms,
+               'outcome': outcome})
+
+
+def log_lookup_done(lookup: LookupResult, started):
+    """Запись журнала о завершении проверки листинга."""
+    latency_ms = round((time.monotonic() - started) * 1000, 1)
+    logging.info(
+        "Проверка %s завершена за %s мс", lookup.listing_id, latency_ms,
+        extra={'listing_id': lookup.listing_id, 'latency_ms': latency_ms,
+               'outcome': 'done'})
+
+
+def get_failure_outcome(error):
+    """Итог площадки для журнала и метрик по исключению."""
+    if isinstance(error, RateLimitTimeout):
+        return 'busy'
+    if isinstance(error, CircuitOpen):
+        return 'unavailable'
+    return 'error'
+
+
+def get_timeout_replies(platform, lookup: LookupResult):
+    """Строки сводного ответа для площадки, не ответившей вовремя."""
+    metrics.inc(
+        'arka_platform_failures_total', platform=platform, reason='timeout')
+    logging.warning(
+        "%s не ответил за %s с. Листинг: %s",
+        platform, PLATFORM_TIMEOUTS[platform], lookup.listing_id)
+    return [format_platform_timeout(platform)]
+
+
+def get_failure_replies(platform, error):
+    """Строки сводного ответа для площадки, завершившейся ошибкой."""
+    if isinstance(error, RateLimitTimeout):
+        log_platform_busy(platform, error)
+        return [format_platform_busy(platform)]
+    if isinstance(error, CircuitOpen):
+        metrics.inc(
+            'arka_platform_failures_total', platform=platform,
+            reason='unavailable')
+        logging.info("Проверка отклонена: %s", str(error))
+        return [format_platform_unavailable(platform)]
+    metrics.inc(
+        'arka_platform_failures_total', platform=platform, reason='error')
+    logging.error("Ошибка при обработке %s: %s", platform, str(error))
+    if isinstance(error, PlatformError) and error.replies:
+        return error.replies
+    return [format_platform_error(platform)]
+
+
+def run_platforms_sequentially(
+        update: Update, context: CallbackContext, lookup: LookupResult):
+    """Последовательный опрос площадок."""
+    lookup_started = time.monotonic()
+    report = create_lookup_report(lookup)
+    for platform, handler in get_platform_handlers():
+        started = time.monotonic()
+        try:
+            replies = run_platform(platform, handler, lookup)
+        except Exception as error:
+            log_platform_result(platform, started, get_failure_outcome(error))
+            replies = get_failure_replies(platform, error)
+        else:
+            log_platform_result(platform, started, 'ok')
+        report.add(platform, replies)
+        publish_report(update, context, report)
+    log_lookup_done(lookup, lookup_started)
+
+
+def run_platforms_concurrently(
+        update: Update, context: CallbackContext, lookup: LookupResult):
+    """Параллельный опрос площадок.
+
+    Ответы собираются в одно сообщение, которое правится по мере ответов
+    площадок, поэтому общее ожидание определяется самой медленной
+    площадкой, а не суммой, а пользователь получает одно уведомление.
+    """
+    started = time.monotonic()
+    report = create_lookup_report(lookup)
+    deadlines = {
+        platform: CallDeadline() for platform, _ in get_platform_handlers()}
+    futures = {
+        submit_with_context(
+            platform_executor, run_platform, platform, handler,
+            lookup, deadlines[platform]): platform
+        for platform, handler in get_platform_handlers()
+    }
+
+    pending = set(futures)
+    while pending:
+        deadline = min(
+            started + PLATFORM_TIMEOUTS[futures[future]]
+            for future in pending)
+        timeout = deadline - time.monotonic()
+        update_in = report.wait_time()
+        if update_in is not None:
+            timeout = min(timeout, update_in)
+        done, pending = wait(
+            pending, timeout=max(0, timeout), return_when=FIRST_COMPLETED)
+        for future in done:
+            platform = futures[future]
+            try:
+                replies = future.result()
+            except Exception as error:
+                log_platform_result(
+                    platform, started, get_failure_outcome(error))
+                replies = get_failure_replies(platform, error)
+            else:
+                log_platform_result(platform, started, 'ok')
+            report.add(platform, replies)
+        for future in list(pending):
+            platform = futures[future]
+            if time.monotonic() >= started + PLATFORM_TIMEOUTS[platform]:
+                pending.discard(future)
+                deadlines[platform].expire()
+                log_platform_result(platform, started, 'timeout')
+                report.add(platform, get_timeout_replies(platform, lookup))
+        publish_report(update, context, report)
+    log_lookup_done(lookup, started)
+
+
+# Проверки выполняются в собственном пуле вместо run_async PTB: так бот
+# знает, сколько принятой работы ещё не выполнено, и отказывает сверх предела.
+lookup_executor = ThreadPoolExecutor(
+    max_workers=BOT_WORKERS, thread_name_prefix='lookup')
+pending_lookups = ConcurrencyLimit(MAX_PENDING_LOOKUPS)
+
+
+def format_overloaded():
+    return (f"{WARNING_SIGN} Сейчас слишком много проверок. "
+            f"Попробуйте через минуту.")
+
+
+def finish_pooled_lookup(future):
+    pending_lookups.release()
+    if future.exception() is not None:
+        logging.error("Ошибка проверки: %s", str(future.exception()))
+
+
+def in_lookup_pool(handler):
+    """Обработчик выполняется в пуле проверок; сверх предела — отказ.
+
+    Декоратор вызывается в потоке диспетчера и сразу возвращает
+    управление, поэтому отказ отправляется через run_async PTB.
+    """
+    @functools.wraps(handler)
+    def wrapper(update: Update, context: CallbackContext):
+        if not pending_lookups.try_acquire():
+            logging.warning(
+                "Проверка отклонена: ожидают выполнения %s",
+                pending_lookups.active)
+            context.dispatcher.run_async(
+                send_message, update, context, format_overloaded(),
+                update=update)
+            return
+        submit_with_context(
+            lookup_executor, handler, update, context
+        ).add_done_callback(finish_pooled_lookup)
+    return wrapper
+
+
+def run_lookup(update: Update, context: CallbackContext,
+               lookup: LookupResult):
+    """Проверка листинга в выбранном режиме."""
+    if BOT_MODE == 'async':
+        # Проверка продолжается в цикле событий и занимает место до конца
+        pending_lookups.acquire()
+        future = async_loop.submit(async_handle_user_input(
+            update.effective_chat.id, lookup, trace_id.get()))
+        future.add_done_callback(log_async_lookup_error)
+        future.add_done_callback(lambda _: pending_lookups.release())
+    elif PARALLEL_LOOKUP:
+        run_platforms_concurrently(update, context, lookup)
+    else:
+        run_platforms_sequentially(update, context, lookup)
+
+
 def handle_user_input(update: Update, context: CallbackContext):
     """Менеджер проверки ссылок на площадках."""
     user_input = update.message.text.strip()
-    logging.info("Пользователь ввел: %s", user_input)
+    with lookup_trace():
+        logging.info("Пользователь ввел: %s", user_input)
+
+        listing_ids = [item for item in parse_listing_ids(user_input) if item]
+        if len(listing_ids) > 1:
+            handle_batch_input(update, context, user_input)
+        elif not listing_ids or not is_valid_user_input(listing_ids[0]):
+            send_message(update, context, "Введите ровно 5 цифр листинга.")
+        else:
+            run_lookup(update, context, LookupResult(listing_ids[0]))
 
-    if not is_valid_user_input(user_input):
-        send_message(update, context, "Введите ровно 5 цифр листинга.")
+
+def handle_refresh_command(update: Update, context: CallbackContext):
+    """Команда /refresh: проверка листинга в обход кэша."""
+    user_input = " ".join(context.args).strip()
+    with lookup_trace():
+        logging.info("Обновление данных по листингу: %s", user_input)
+        if not is_valid_user_input(user_input):
+            send_message(update, context, "Использование: /refresh 12345")
+        else:
+            run_lookup(
+                update, context, LookupResult(user_input, refresh=True))
+
+
+# Асинхронный режим (BOT_MODE=async): запросы проверок к ЦИАН, Яндексу,
+# Авито и Bot API идут корутинами в одном цикле событий через общие
+# клиенты httpx. Отчёт ДомКлик загружается блокирующей сессией requests
+# в собственном пуле потоков, чтобы долгая загрузка не занимала пул цикла,
+# в котором обновляется токен Авито.
+
+async_loop = EventLoopThread('async-lookups')
+domclick_executor = ThreadPoolExecutor(
+    max_workers=ASYNC_DOMCLICK_WORKERS, thread_name_prefix='domclick')
+async_clients = {}
+async_lookup_limit = None
+
+
+def get_async_client(platform):
+    """Общий асинхронный клиент площадки, создаётся внутри цикла."""
+    if platform not in async_clients:
+        async_clients[platform] = create_async_client(
+            HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE)
+    return async_clients[platform]
+
+
+async def close_async_clients():
+    for client in async_clients.values():
+        await client.aclose()
+    async_clients.clear()
+
+
+async def async_platform_request(platform, method, url, **kwargs):
+    return await async_request(
+        get_async_client(platform), method, url, HTTP_RETRIES, HTTP_BACKOFF,
+        platform=platform, limiter=rate_limiters.get(platform),
+        retry_post=platform in RETRY_POST_PLATFORMS, **kwargs)
+
+
+async def async_telegram_request(url, chat_id, **kwargs):
+    """Запрос к Bot API в очереди чата; возвращает result или None."""
+    await telegram_sender.async_acquire(chat_id)
+    response = await async_platform_request(
+        'Telegram', 'POST', url, json={'chat_id': chat_id, **kwargs})
+    if response.status_code != 200:
+        logging.warning(
+            "Ошибка отправки сообщения в Telegram. Код ответа: %s",
+            response.status_code)
+        return None
+    return response.json().get('result')
+
+
+async def async_send_message(chat_id, text):
+    result = await async_telegram_request(
+        URL_TELEGRAM_SEND_MESSAGE, chat_id, text=text)
+    return result['message_id'] if result else None
+
+
+async def async_publish_report(chat_id, report: LookupReport):
+    """Асинхронная отправка или правка сводного ответа."""
+    if report.wait_time() != 0:
+        return
+    text = report.render()
+    if report.message_id is None:
+        report.mark_published(
+            text, await async_send_message(chat_id, text))
     else:
-        try:
-            # Handle CIAN input
-            handle_cian_input(update, context, user_input)
-        except Exception as cian_error:
-            logging.error("Ошибка при обработке CIAN: %s", str(cian_error))
+        await async_telegram_request(
+            URL_TELEGRAM_EDIT_MESSAGE, chat_id,
+            message_id=report.message_id, text=text)
+        report.mark_published(text, report.message_id)
+
+
+async def async_avito_request(method, url, **kwargs):
+    """Асинхронный запрос к API авито, аналог avito_request.
+
+    Действующий токен берётся из общего TokenManager сразу; только его
+    обновление уходит в пул потоков цикла, чтобы не блокировать
+    остальные корутины.
+    """
+    loop = asyncio.get_running_loop()
+    token = avito_token.cached()
+    if token is None:
+        token = await loop.run_in_executor(None, avito_token.get)
+    response = None
+    for attempt in range(AVITO_AUTH_RETRIES + 1):
+        if token is None:
+            return None
+        headers = {'Authorization': f'Bearer {token}'}
+        response = await async_platform_request(
+            'Avito', method, url, headers=headers, **kwargs)
+        if response.status_code != 403 or attempt == AVITO_AUTH_RETRIES:
+            break
+        metrics.inc('arka_avito_auth_retries_total')
+        token = await loop.run_in_executor(None, avito_token.refresh, token)
+    return response
 
-        try:
-            # Handle Yandex input
-            handle_yandex_input(update, context, user_input)
-        except Exception as yandex_error:
-            logging.error("Ошибка при обработке Yandex: %s", str(yandex_error))
 
+async def async_handle_avito_input(lookup: LookupResult):
+    """Получени ссылки с Авито."""
+    with platform_call('Avito'):
+        response = await async_avito_request(
+            'GET', f'{URL_GET_AVITO_ID_LISTING}{lookup.listing_id}')
+        lookup.avito_id = avito_id_from_response(response)
+        if not lookup.avito_id:
+            return [f"{RED_CROSS} Объявление на Avito не найдено."]
+
+        stats_response, status_response = await asyncio.gather(
+            async_avito_request(
+                'POST', URL_GET_AVITO_STATS,
+                json=avito_stats_request_body([lookup.avito_id])),
+            async_avito_request(
+                'GET', f'{URL_GET_AVITO_URL}{lookup.avito_id}/'),
+        )
+        url = avito_url_from_response(status_response)
+        stats = avito_stats_from_response(stats_response)
+    if url:
+        return [format_avito_message(url, *stats)]
+    return []
+
+
+async def async_handle_cian_input(lookup: LookupResult):
+    """Получени ссылки с Циан, аналог handle_cian_input."""
+    if cian_index.is_fresh() and not lookup.refresh:
+        return get_cian_index_replies(lookup.listing_id)
+    if CIAN_INDEX_REFRESH:
+        cian_index.refresh_in_background()
+    with platform_call('CIAN'):
+        response_cian = await async_platform_request(
+            'CIAN', 'GET', URL_GET_CIAN_FEED, headers=get_cian_headers(),
+            params={"externalId": lookup.listing_id})
+        return get_cian_replies(response_cian, lookup.listing_id)
+
+
+async def async_handle_yandex_input(lookup: LookupResult):
+    """Получение ссылки с Яндекс, аналог handle_yandex_input."""
+    if yandex_index.is_fresh() and not lookup.refresh:
+        return get_yandex_index_replies(lookup.listing_id)
+    if YANDEX_INDEX_REFRESH:
+        yandex_index.refresh_in_background()
+
+    with platform_call('Yandex'):
+        replies = await async_scan_yandex_feed(lookup)
+    return replies
+
+
+async def async_scan_yandex_feed(lookup: LookupResult):
+    """Асинхронный обход фида Яндекса, аналог scan_yandex_feed."""
+    page_limit = asyncio.Semaphore(YANDEX_PAGE_CONCURRENCY)
+
+    async def fetch_page(offset):
+        async with page_limit:
+            return decode_yandex_page(await async_platform_request(
+                'Yandex', 'GET', URL_GET_YANDEX_FEED,
+                headers=get_yandex_headers(),
+                params=yandex_page_params(offset)))
+
+    replies = []
+    pages = 1
+    first_page = await fetch_page(0)
+    if (not process_yandex_page(first_page, lookup, replies)
+            and first_page is not None):
+        tasks = [
+            asyncio.ensure_future(fetch_page(offset))
+            for offset in yandex_page_offsets(first_page)
+        ]
         try:
-            # Handle Avito input
-            handle_avito_input(update, context, user_input)
-        except Exception as avito_error:
-            logging.error("Ошибка при обработке Avito: %s", str(avito_error))
+            for next_page in asyncio.as_completed(tasks):
+                pages += 1
+                if process_yandex_page(await next_page, lookup, replies):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+    metrics.observe('arka_yandex_scan_pages', pages)
+
+    return finish_yandex_scan(lookup, replies)
+
+
+async def async_handle_domclick_input(lookup: LookupResult):
+    """Получени ссылки с ДомКлик.
+
+    Ответ по свежему индексу выдаётся сразу. Обновление отчёта остаётся
+    блокирующим: это потоковый разбор XML сессией requests, общий с режимом
+    потоков и защищённый блокировкой индекса, поэтому оно выполняется
+    в отдельном пуле domclick_executor и не задерживает запросы Авито.
+    """
+    if domclick_index.is_fresh() and not lookup.refresh:
+        return format_domclick_replies(
+            domclick_index.get(lookup.listing_id))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        domclick_executor, get_domclick_replies, lookup.listing_id,
+        lookup.refresh)
+
+
+def get_async_platform_handlers():
+    """Асинхронные обработчики площадок."""
+    return (
+        ('CIAN', async_handle_cian_input),
+        ('Yandex', async_handle_yandex_input),
+        ('Avito', async_handle_avito_input),
+        ('DomClick', async_handle_domclick_input),
+    )
 
-        try:
-            # Handle DomClick input
-            handle_domclick_input(update, context, user_input)
-        except Exception as domclick_error:
-            logging.error(
-                "Ошибка при обработке DomClick: %s", str(domclick_error))
+
+async def async_run_handler(platform, handler, lookup: LookupResult):
+    """Асинхронный вызов обработчика площадки с замером времени."""
+    with metrics.timer('arka_handler_seconds', platform=platform):
+        return await handler(lookup)
+
+
+async def async_run_platform(platform, handler, lookup):
+    """Ответы площадки из локальной базы, кэша или от обработчика.
+
+    Возвращает площадку и строки для сводного ответа, включая сообщения
+    о таймауте и ошибках.
+    """
+    # Задача выполняется в своей копии контекста: площадку не сбрасываем
+    log_platform.set(platform)
+    deadline = CallDeadline()
+    current_deadline.set(deadline)
+    started = time.monotonic()
+    replies = None
+    if not lookup.refresh:
+        replies = get_stored_replies(platform, lookup.listing_id)
+        if replies is not None:
+            metrics.inc('arka_store_replies_total', platform=platform)
+    try:
+        if replies is None:
+            replies = await asyncio.wait_for(
+                result_cache.async_get_or_compute(
+                    (platform, lookup.listing_id),
+                    lambda: async_run_handler(platform, handler, lookup),
+                    refresh=lookup.refresh),
+                PLATFORM_TIMEOUTS[platform])
+    except asyncio.TimeoutError:
+        deadline.expire()
+        log_platform_result(platform, started, 'timeout')
+        replies = get_timeout_replies(platform, lookup)
+    except asyncio.CancelledError:
+        deadline.expire()
+        raise
+    except Exception as error:
+        log_platform_result(platform, started, get_failure_outcome(error))
+        replies = get_failure_replies(platform, error)
+    else:
+        log_platform_result(platform, started, 'ok')
+    return platform, replies
+
+
+async def async_handle_user_input(chat_id, lookup: LookupResult,
+                                  trace=None):
+    """Асинхронная проверка листинга на всех площадках сразу.
+
+    trace — trace_id проверки из потока, принявшего сообщение.
+    """
+    global async_lookup_limit
+    if async_lookup_limit is None:
+        async_lookup_limit = asyncio.Semaphore(ASYNC_MAX_LOOKUPS)
+    if trace is not None:
+        trace_id.set(trace)
+
+    started = time.monotonic()
+    report = create_lookup_report(lookup)
+
+    async with async_lookup_limit:
+        pending = {
+            asyncio.ensure_future(
+                async_run_platform(platform, handler, lookup))
+            for platform, handler in get_async_platform_handlers()
+        }
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=report.wait_time(),
+                return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                report.add(*task.result())
+            await async_publish_report(chat_id, report)
+    log_lookup_done(lookup, started)
+
+
+def log_async_lookup_error(future):
+    if future.exception() is not None:
+        logging.error(
+            "Ошибка асинхронной проверки: %s", str(future.exception()))
+
+
+def run_webhook(updater: Updater):
+    """Обслуживание обновлений через webhook до сигнала остановки."""
+    server = WebhookServer(
+        updater.dispatcher, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+        WEBHOOK_MAX_CONCURRENCY, WEBHOOK_MAX_BACKLOG,
+        backlog=lambda: (updater.dispatcher.update_queue.qsize() +
+                         pending_lookups.active),
+        secret=WEBHOOK_SECRET)
+    if WEBHOOK_URL:
+        updater.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH.lstrip('/')}",
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            api_kwargs=(
+                {'secret_token': WEBHOOK_SECRET} if WEBHOOK_SECRET else None))
+
+    updater.job_queue.start()
+    threading.Thread(
+        target=updater.dispatcher.start, name='dispatcher', daemon=True
+    ).start()
+    server.start()
+
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop_event.set())
+    while not stop_event.wait(1):
+        pass
+
+    server.stop()
+    updater.stop()
 
 
 def main():
-    updater = Updater(token=TELEGRAM_TOKEN_AVITO)
+    updater = Updater(token=TELEGRAM_TOKEN_AVITO, workers=BOT_WORKERS)
 
     updater.dispatcher.add_handler(CommandHandler('start', start))
+    updater.dispatcher.add_handler(
+        CommandHandler('check', in_lookup_pool(handle_check_command)))
+    updater.dispatcher.add_handler(
+        CommandHandler('refresh', in_lookup_pool(handle_refresh_command)))
+    updater.dispatcher.add_handler(
+        CommandHandler(
+            'portfolio', in_lookup_pool(handle_portfolio_command)))
+    updater.dispatcher.add_handler(
+        CommandHandler('watch', handle_watch_command))
+    updater.dispatcher.add_handler(
+        CommandHandler('unwatch', handle_unwatch_command))
+    updater.dispatcher.add_handler(
+        CommandHandler('stats', handle_stats_command))
+    updater.dispatcher.add_handler(
+        CommandHandler('errors', handle_errors_command))
 
     message_handler = MessageHandler(
-        Filters.text & ~Filters.command, handle_user_input
+        Filters.text & ~Filters.command, in_lookup_pool(handle_user_input)
     )
     updater.dispatcher.add_handler(message_handler)
 
-    updater.start_polling()
-    updater.idle()
+    if listing_store is not None or cache_store is not None:
+        warm_caches()
+    updater.job_queue.run_repeating(
+        refresh_avito_token, interval=AVITO_TOKEN_CHECK_INTERVAL, first=0)
+    if CIAN_INDEX_REFRESH:
+        updater.job_queue.run_repeating(
+            refresh_cian_index, interval=CIAN_INDEX_REFRESH, first=0)
+    if YANDEX_INDEX_REFRESH:
+        updater.job_queue.run_repeating(
+            refresh_yandex_index, interval=YANDEX_INDEX_REFRESH, first=0)
+    if DOMCLICK_INDEX_REFRESH:
+        updater.job_queue.run_repeating(
+            refresh_domclick_index, interval=DOMCLICK_INDEX_REFRESH, first=0)
+    if listing_store is not None:
+        updater.job_queue.run_repeating(
+            sync_platforms, interval=SYNC_INTERVAL, first=0)
+    if WATCH_INTERVAL:
+        updater.job_queue.run_repeating(
+            check_watched_listings, interval=WATCH_INTERVAL, first=0)
+
+    if BOT_MODE == 'async':
+        async_loop.start()
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(metrics, METRICS_LISTEN, METRICS_PORT)
+        metrics_server.start()
+
+    if BOT_UPDATES == 'webhook':
+        run_webhook(updater)
+    else:
+        updater.start_polling()
+        updater.idle()
+
+    if async_loop.is_running():
+        async_loop.submit(close_async_clients()).result()
+        async_loop.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if cache_store is not None:
+        save_caches()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+
+class EventLoopThread:
+    """Цикл событий asyncio в отдельном фоновом потоке.
+
+    Позволяет запускать корутины из потоков диспетчера Telegram:
+    submit возвращает concurrent.futures.Future с результатом корутины.
+    """
+
+    def __init__(self, name):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
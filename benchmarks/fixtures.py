@@ -0,0 +1,115 @@
+"""Синтетические и записанные ответы площадок для бенчмарков.
+
+Листинги нумеруются подряд с FIRST_LISTING_ID, а ссылки объявлений
+заканчиваются номером листинга, поэтому по тексту ответа видно, к какому
+листингу он относится.
+"""
+import json
+import os
+from xml.sax.saxutils import escape
+
+FIRST_LISTING_ID = 10000
+YANDEX_ERRORS = ('PHOTO_TOO_SMALL', 'NO_PRICE', 'DUPLICATE')
+
+
+def listing_ids(offers):
+    return [str(FIRST_LISTING_ID + number) for number in range(offers)]
+
+
+def avito_id(listing_id):
+    return 1000000 + int(listing_id)
+
+
+def generate_yandex_offers(offers):
+    """Объявления фида Яндекса; у каждого десятого есть ошибки."""
+    return [
+        {
+            "internalId": listing_id,
+            "url": f"https://realty.yandex.ru/offer/{listing_id}",
+            "state": {"errors": [
+                {"type": YANDEX_ERRORS[number % len(YANDEX_ERRORS)]}
+            ] if number % 10 == 9 else []},
+        }
+        for number, listing_id in enumerate(listing_ids(offers))
+    ]
+
+
+def generate_cian_offers(offers):
+    """Объявления заказа ЦИАН; каждое двадцатое не публикуется."""
+    return [
+        {
+            "externalId": listing_id,
+            "status": "Published" if number % 20 else "Rejected",
+            "url": f"https://cian.ru/sale/flat/{listing_id}",
+            "errors": [] if number % 20 else ["Нет фотографий"],
+        }
+        for number, listing_id in enumerate(listing_ids(offers))
+    ]
+
+
+def generate_domclick_report(offers):
+    """XML-отчёт ДомКлик; у каждого пятнадцатого отклонена скидка."""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<Report><OfferList>']
+    for number, listing_id in enumerate(listing_ids(offers)):
+        discount = 'rejected' if number % 15 == 14 else 'approved'
+        parts.append(
+            f'<Offer><ExternalId>{listing_id}</ExternalId>'
+            f'<Status><Code>published</Code></Status>'
+            f'<Publication><DomclickURL>'
+            f'{escape(f"https://domclick.ru/card/{listing_id}")}'
+            f'</DomclickURL></Publication>'
+            f'<DiscountStatus><Code>{discount}</Code><RejectionReasons>'
+            f'<Reason><Descr>Цена выше рынка</Descr></Reason>'
+            f'</RejectionReasons></DiscountStatus></Offer>')
+    parts.append('</OfferList></Report>')
+    return ''.join(parts).encode()
+
+
+def generate_avito_items(offers):
+    """Активные объявления Авито; каждое восьмое снято с публикации."""
+    return {
+        avito_id(listing_id): {
+            "status": "active" if number % 8 else "removed",
+            "url": f"https://avito.ru/item/{listing_id}",
+        }
+        for number, listing_id in enumerate(listing_ids(offers))
+    }
+
+
+class Fixtures:
+    """Данные всех площадок для заглушки.
+
+    Если в directory есть записанные ответы (yandex_offers.json — список
+    offer, cian_offers.json — список offers из get-order, domclick.xml —
+    отчёт), они используются вместо синтетических.
+    """
+
+    def __init__(self, offers, directory=None):
+        self.offers = offers
+        self.yandex_offers = self._load_json(
+            directory, 'yandex_offers.json') or generate_yandex_offers(offers)
+        self.cian_offers = self._load_json(
+            directory, 'cian_offers.json') or generate_cian_offers(offers)
+        self.domclick_report = self._load_bytes(
+            directory, 'domclick.xml') or generate_domclick_report(offers)
+        self.avito_items = generate_avito_items(offers)
+        self.cian_by_id = {
+            offer["externalId"]: offer for offer in self.cian_offers}
+
+    @staticmethod
+    def _load_bytes(directory, name):
+        if directory is None:
+            return None
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as fixture:
+            return fixture.read()
+
+    @classmethod
+    def _load_json(cls, directory, name):
+        data = cls._load_bytes(directory, name)
+        return json.loads(data) if data is not None else None
+
+    def listing_ids(self):
+        return [offer["internalId"] for offer in self.yandex_offers]
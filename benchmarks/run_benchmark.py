@@ -0,0 +1,228 @@
+"""Нагрузочный прогон проверок листингов на заглушке площадок.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run_benchmark --offers 10000 --concurrency 1,8,32
+
+Каждый уровень параллельности начинается с чистого состояния бота (кэш
+ответов и индексы сброшены) или, с --warm, с загруженными индексами.
+Проверки идут через handle_user_input с имитацией обновлений Telegram,
+сообщения бота уходят в заглушку Telegram.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+os.environ.setdefault('TELEGRAM_TOKEN_AVITO', '123456:bench')
+os.environ.setdefault('AVITO_ID_COMPANY', 'bench')
+os.environ.setdefault('DOMCLICK_ID_COMPANY', 'bench')
+os.environ.setdefault('YANDEX_FEED_ID', 'bench')
+# Журнал бенчмарка пишется во временный каталог, а не в репозиторий
+os.environ.setdefault(
+    'LOG_FILE', os.path.join(tempfile.gettempdir(), 'arka_benchmark.log'))
+# Локальные базы и метрики в бенчмарке не участвуют
+os.environ['SYNC_DB_PATH'] = ''
+os.environ['CACHE_DB_PATH'] = ''
+os.environ['METRICS_PORT'] = '0'
+# Лимиты частоты реальных API заглушке не нужны; их можно задать явно
+for platform in ('CIAN', 'YANDEX', 'AVITO', 'DOMCLICK'):
+    os.environ.setdefault(f'{platform}_RATE_LIMIT', '0')
+os.environ.setdefault('TELEGRAM_RATE_LIMIT', '0')
+os.environ.setdefault('TELEGRAM_CHAT_RATE_LIMIT', '0')
+
+import arka_bot  # noqa: E402
+from benchmarks.fixtures import Fixtures  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+from offer_index import OfferIndex  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+from telegram import Bot, Update  # noqa: E402
+from telegram.utils.request import Request  # noqa: E402
+
+PLATFORMS = ('CIAN', 'Yandex', 'Avito', 'DomClick')
+URL_NAMES = (
+    'URL_GET_AVITO_TOKEN', 'URL_GET_AVITO_ID_LISTING', 'URL_GET_AVITO_URL',
+    'URL_GET_AVITO_STATS', 'URL_GET_AVITO_ITEMS', 'URL_GET_YANDEX_FEED',
+    'URL_GET_CIAN_FEED', 'URL_GET_DOMCLICK_REPORT',
+    'URL_TELEGRAM_SEND_MESSAGE', 'URL_TELEGRAM_EDIT_MESSAGE',
+)
+
+
+def point_bot_to_stub(base_url):
+    """Адреса всех площадок бота на заглушку с теми же путями."""
+    for name in URL_NAMES:
+        url = urlsplit(getattr(arka_bot, name))
+        path = url.path + (f'?{url.query}' if url.query else '')
+        setattr(arka_bot, name, base_url + path)
+
+
+def reset_bot_state():
+    """Пустой кэш ответов и незагруженные индексы площадок."""
+    arka_bot.result_cache = ResultCache(
+        arka_bot.RESULT_CACHE_SIZE, arka_bot.RESULT_CACHE_TTL)
+    arka_bot.cian_index = OfferIndex(
+        'CIAN', arka_bot.load_cian_offers, arka_bot.CIAN_INDEX_TTL)
+    arka_bot.yandex_index = OfferIndex(
+        'Yandex', arka_bot.load_yandex_offers, arka_bot.YANDEX_INDEX_TTL)
+    arka_bot.domclick_index = OfferIndex(
+        'DomClick', arka_bot.load_domclick_offers,
+        arka_bot.DOMCLICK_INDEX_TTL)
+    arka_bot.cian_order_validators.clear()
+    arka_bot.domclick_report_validators.clear()
+
+
+def make_update(bot, chat_id, text):
+    return Update.de_json({
+        'update_id': chat_id,
+        'message': {
+            'message_id': chat_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text,
+        },
+    }, bot)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def count_mismatches(messages, lookups):
+    """Ответы, в ссылках которых есть чужой листинг."""
+    mismatches = 0
+    for chat_id, listing_id in lookups.items():
+        for text in messages.get(chat_id, []):
+            found = set(re.findall(r'/(\d{5})\b', text or ''))
+            mismatches += bool(found - {listing_id})
+    return mismatches
+
+
+def run_level(bot, stub, listing_ids, concurrency, lookups_count, warm,
+              trace_memory):
+    """Один уровень параллельности; возвращает словарь результатов."""
+    reset_bot_state()
+    if warm:
+        arka_bot.cian_index.refresh()
+        arka_bot.yandex_index.refresh()
+        arka_bot.domclick_index.refresh()
+    stub.reset()
+
+    lookups = {
+        chat_id: random.choice(listing_ids)
+        for chat_id in range(1, lookups_count + 1)
+    }
+    latencies = []
+
+    def lookup(chat_id):
+        context = SimpleNamespace(bot=bot, args=[])
+        update = make_update(bot, chat_id, lookups[chat_id])
+        started = time.perf_counter()
+        arka_bot.handle_user_input(update, context)
+        latencies.append(time.perf_counter() - started)
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lookup, lookups))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    if trace_memory:
+        tracemalloc.stop()
+
+    platform_calls = sum(stub.calls[platform] for platform in PLATFORMS)
+    return {
+        'concurrency': concurrency,
+        'lookups': lookups_count,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'rps': lookups_count / elapsed,
+        'http_per_lookup': platform_calls / lookups_count,
+        'calls': {platform: stub.calls[platform] for platform in PLATFORMS},
+        'peak_mb': peak / 1024 / 1024,
+        'mismatches': count_mismatches(stub.messages, lookups),
+    }
+
+
+def format_result(result):
+    calls = ' '.join(
+        f"{platform}={count}" for platform, count in result['calls'].items())
+    return (f"{result['concurrency']:>11} {result['lookups']:>7} "
+            f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+            f"{result['rps']:>8.1f} {result['http_per_lookup']:>11.2f} "
+            f"{result['peak_mb']:>8.1f} {result['mismatches']:>10}  {calls}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--offers', type=int, default=10000,
+        help='объявлений в синтетических фидах (не больше 89999)')
+    parser.add_argument(
+        '--lookups', type=int, default=200,
+        help='проверок на каждом уровне параллельности')
+    parser.add_argument(
+        '--concurrency', default='1,8,32',
+        help='уровни параллельности через запятую')
+    parser.add_argument(
+        '--latency', type=float, default=0.02,
+        help='задержка ответа площадок в заглушке, с')
+    parser.add_argument(
+        '--fixtures', help='каталог с записанными ответами площадок')
+    parser.add_argument(
+        '--warm', action='store_true',
+        help='загрузить индексы ЦИАН, Яндекса и ДомКлик до замера')
+    parser.add_argument(
+        '--sequential', action='store_true',
+        help='опрашивать площадки последовательно (PARALLEL_LOOKUP=0)')
+    parser.add_argument(
+        '--no-memory', action='store_true',
+        help='не измерять пиковую память (tracemalloc замедляет прогон)')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    fixtures = Fixtures(args.offers, args.fixtures)
+    stub = StubServer(fixtures, arka_bot.YANDEX_PAGE_SIZE, args.latency)
+    stub.start()
+    point_bot_to_stub(stub.base_url)
+    arka_bot.PARALLEL_LOOKUP = not args.sequential
+    levels = [int(level) for level in args.concurrency.split(',')]
+    bot = Bot(
+        arka_bot.TELEGRAM_TOKEN_AVITO, base_url=f'{stub.base_url}/bot',
+        request=Request(con_pool_size=max(levels) + 4))
+
+    # Часть проверок приходится на листинги, которых нет ни на одной площадке
+    listing_ids = fixtures.listing_ids()
+    listing_ids += [
+        str(99999 - number) for number in range(len(listing_ids) // 10)]
+
+    print(f"Объявлений: {len(fixtures.yandex_offers)}, отчёт ДомКлик "
+          f"{len(fixtures.domclick_report) / 1024 / 1024:.1f} МБ, "
+          f"задержка площадок {args.latency * 1000:.0f} мс, "
+          f"{'прогретые' if args.warm else 'пустые'} индексы")
+    print(f"{'concurrency':>11} {'lookups':>7} {'p50, ms':>8} "
+          f"{'p95, ms':>8} {'rps':>8} {'http/lookup':>11} "
+          f"{'peak, MB':>8} {'mismatches':>10}  calls")
+    try:
+        for level in levels:
+            print(format_result(run_level(
+                bot, stub, listing_ids, level, args.lookups, args.warm,
+                not args.no_memory)))
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
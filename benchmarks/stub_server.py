@@ -0,0 +1,212 @@
+"""Локальная заглушка API площадок и Telegram для бенчмарков."""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fixtures import avito_id
+
+DOMCLICK_ETAG = '"bench-report"'
+
+
+class StubServer:
+    """HTTP-сервер, отвечающий данными Fixtures на запросы всех площадок.
+
+    Считает запросы по площадкам и запоминает сообщения, отправленные
+    в Telegram, по чатам. latency — задержка ответа площадок, с.
+    """
+
+    def __init__(self, fixtures, page_size, latency=0.0):
+        self.fixtures = fixtures
+        self.page_size = page_size
+        self.latency = latency
+        self.calls = Counter()
+        self.messages = {}
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._routes = (
+            ('POST', r'/token/$', 'Avito', self.avito_token),
+            ('GET', r'/autoload/v2/items/avito_ids$', 'Avito',
+             self.avito_ids),
+            ('GET', r'/core/v1/accounts/[^/]+/items/(\d+)/$', 'Avito',
+             self.avito_item),
+            ('POST', r'/stats/v1/accounts/[^/]+/items$', 'Avito',
+             self.avito_stats),
+            ('GET', r'/core/v1/items$', 'Avito', self.avito_items),
+            ('GET', r'/2.0/crm/offers$', 'Yandex', self.yandex_offers),
+            ('GET', r'/v1/get-order$', 'CIAN', self.cian_order),
+            ('GET', r'/api/v1/company/[^/]+/report/$', 'DomClick',
+             self.domclick_report),
+            ('POST', r'/bot[^/]+/sendMessage$', 'Telegram',
+             self.telegram_send_message),
+            ('POST', r'/bot[^/]+/editMessageText$', 'Telegram',
+             self.telegram_edit_message),
+        )
+        self.httpd = ThreadingHTTPServer(
+            ('127.0.0.1', 0), self._make_request_handler())
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 128
+
+    @property
+    def base_url(self):
+        return 'http://%s:%s' % self.httpd.server_address[:2]
+
+    def start(self):
+        threading.Thread(
+            target=self.httpd.serve_forever, name='stub-server', daemon=True
+        ).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.messages.clear()
+
+    def _make_request_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.dispatch(self, 'GET')
+
+            def do_POST(self):
+                server.dispatch(self, 'POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+    def dispatch(self, request, method):
+        url = urlsplit(request.path)
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        for route_method, pattern, platform, handler in self._routes:
+            match = re.search(pattern, url.path)
+            if route_method == method and match:
+                with self._lock:
+                    self.calls[platform] += 1
+                if platform != 'Telegram' and self.latency:
+                    time.sleep(self.latency)
+                status, headers, payload = handler(
+                    request, match, parse_qs(url.query), body)
+                return self.respond(request, status, headers, payload)
+        self.respond(request, HTTPStatus.NOT_FOUND, {}, b'')
+
+    @staticmethod
+    def respond(request, status, headers, payload):
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload, ensure_ascii=False).encode()
+            headers = dict(headers, **{'Content-Type': 'application/json'})
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def avito_token(self, request, match, query, body):
+        return HTTPStatus.OK, {}, {
+            'access_token': 'bench', 'expires_in': 86400}
+
+    def avito_ids(self, request, match, query, body):
+        ids = ','.join(query.get('query', [])).split(',')
+        known = set(self.fixtures.listing_ids())
+        return HTTPStatus.OK, {}, {'items': [
+            {'ad_id': int(listing_id), 'avito_id': avito_id(listing_id)}
+            for listing_id in ids if listing_id in known
+        ]}
+
+    def avito_item(self, request, match, query, body):
+        item = self.fixtures.avito_items.get(int(match.group(1)))
+        if item is None:
+            return HTTPStatus.NOT_FOUND, {}, {}
+        return HTTPStatus.OK, {}, item
+
+    def avito_stats(self, request, match, query, body):
+        item_ids = json.loads(body).get('itemIds', [])
+        return HTTPStatus.OK, {}, {'result': {'items': [
+            {'itemId': item_id, 'stats': [{
+                'uniqViews': item_id % 500,
+                'uniqContacts': item_id % 7,
+                'uniqFavorites': item_id % 11,
+            }]}
+            for item_id in item_ids
+        ]}}
+
+    def avito_items(self, request, match, query, body):
+        active = [
+            {'id': item_id, 'url': item['url']}
+            for item_id, item in self.fixtures.avito_items.items()
+            if item['status'] == 'active'
+        ]
+        per_page = int(query.get('per_page', ['100'])[0])
+        page = int(query.get('page', ['1'])[0])
+        return HTTPStatus.OK, {}, {
+            'resources': active[(page - 1) * per_page:page * per_page]}
+
+    def yandex_offers(self, request, match, query, body):
+        offset = int(query.get('offset', ['0'])[0])
+        offers = self.fixtures.yandex_offers
+        return HTTPStatus.OK, {}, {'listing': {
+            'snippets': [
+                {'offer': offer}
+                for offer in offers[offset:offset + self.page_size]
+            ],
+            'slicing': {'total': len(offers)},
+        }}
+
+    def cian_order(self, request, match, query, body):
+        external_ids = query.get('externalId')
+        if external_ids:
+            offers = [
+                self.fixtures.cian_by_id[external_id]
+                for external_id in external_ids
+                if external_id in self.fixtures.cian_by_id
+            ]
+        else:
+            offers = self.fixtures.cian_offers
+        return HTTPStatus.OK, {}, {'result': {'offers': offers}}
+
+    def domclick_report(self, request, match, query, body):
+        if request.headers.get('If-None-Match') == DOMCLICK_ETAG:
+            return HTTPStatus.NOT_MODIFIED, {'ETag': DOMCLICK_ETAG}, b''
+        return HTTPStatus.OK, {
+            'ETag': DOMCLICK_ETAG, 'Content-Type': 'application/xml',
+        }, self.fixtures.domclick_report
+
+    def telegram_send_message(self, request, match, query, body):
+        data = json.loads(body or b'{}')
+        chat_id = int(data.get('chat_id'))
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+            self.messages.setdefault(chat_id, []).append(data.get('text'))
+        return HTTPStatus.OK, {}, {'ok': True, 'result': {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': data.get('text'),
+        }}
+
+    def telegram_edit_message(self, request, match, query, body):
+        data = json.loads(body or b'{}')
+        chat_id = int(data.get('chat_id'))
+        with self._lock:
+            self.messages.setdefault(chat_id, []).append(data.get('text'))
+        return HTTPStatus.OK, {}, {'ok': True, 'result': {
+            'message_id': int(data.get('message_id')),
+            'date': int(time.time()),
+            'edit_date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': data.get('text'),
+        }}
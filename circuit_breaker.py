@@ -0,0 +1,151 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpen(Exception):
+    """Площадка отключена автоматом после серии ошибок."""
+
+
+class CallDeadline:
+    """Срок вызова площадки, общий для автомата и ждущей его проверки.
+
+    Проверка, переставшая ждать по таймауту, вызывает expire: автомат
+    сразу получает ошибку, а поздний итог зависшего вызова уже не
+    учитывается. Блок guard находит срок через current_deadline.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breaker = None
+        self._started = None
+        self._finished = False
+
+    def start(self, breaker):
+        with self._lock:
+            self._breaker = breaker
+            self._started = time.monotonic()
+            self._finished = False
+
+    def finish(self):
+        """Итог вызова; False, если срок уже засчитан ошибкой."""
+        with self._lock:
+            if self._finished:
+                return False
+            self._finished = True
+            return True
+
+    def expire(self):
+        """Срок истёк: незавершённый вызов засчитывается ошибкой."""
+        with self._lock:
+            if self._started is None or self._finished:
+                return
+            self._finished = True
+            breaker, started = self._breaker, self._started
+        breaker.record(time.monotonic() - started, failed=True)
+
+
+# Срок текущего вызова площадки; задаётся проверкой перед обработчиком
+current_deadline = contextvars.ContextVar('current_deadline', default=None)
+
+
+class CircuitBreaker:
+    """Автомат площадки: быстрый отказ, пока площадка не отвечает.
+
+    После failure_threshold ошибок или ответов дольше slow_call секунд
+    подряд автомат размыкается, и вызовы сразу получают CircuitOpen.
+    Через reset_timeout секунд пропускается один пробный вызов: успех
+    замыкает автомат, ошибка снова размыкает его. failure_threshold=0
+    выключает автомат.
+    """
+
+    def __init__(self, name, failure_threshold, slow_call, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Разрешение на вызов; при разомкнутом автомате — CircuitOpen."""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and (
+                    now - self._opened_at >= self.reset_timeout):
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and (
+                    self._probe_started is None
+                    or now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return
+            if self.state != CLOSED:
+                self.rejected += 1
+                raise CircuitOpen(f"{self.name}: автомат разомкнут")
+
+    def record(self, seconds, failed=False):
+        """Итог вызова: длительность и была ли ошибка."""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if failed or (self.slow_call and seconds >= self.slow_call):
+                self.failures += 1
+                if (self.state == HALF_OPEN
+                        or self.failures >= self.failure_threshold):
+                    self._opened_at = time.monotonic()
+                    self._set_state(OPEN)
+            else:
+                self.failures = 0
+                self._set_state(CLOSED)
+
+    def cancel(self):
+        """Вызов не дошёл до площадки: пробный вызов можно повторить."""
+        with self._lock:
+            self._probe_started = None
+
+    @contextmanager
+    def guard(self, ignore=()):
+        """Блок с вызовом площадки; исключения ignore не считаются ошибкой.
+
+        Отмена (например, asyncio.CancelledError) считается ошибкой. Если
+        задан current_deadline и он истёк раньше, итог блока не
+        записывается: ошибку уже засчитал expire.
+        """
+        self.before_call()
+        deadline = current_deadline.get()
+        if deadline is not None:
+            deadline.start(self)
+        started = time.monotonic()
+        try:
+            yield
+        except ignore:
+            if deadline is None or deadline.finish():
+                self.cancel()
+            raise
+        except BaseException:
+            if deadline is None or deadline.finish():
+                self.record(time.monotonic() - started, failed=True)
+            raise
+        else:
+            if deadline is None or deadline.finish():
+                self.record(time.monotonic() - started)
+
+    def _set_state(self, state):
+        """Смена состояния под блокировкой."""
+        self._probe_started = None
+        if state != self.state:
+            logging.warning(
+                "Автомат %s: %s -> %s", self.name, self.state, state)
+            self.state = state
@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class DailyStatsCache:
+    """Посуточная статистика объявлений: {день: {объявление: значения}}.
+
+    Для каждого дня запоминается, по каким объявлениям он загружен, поэтому
+    объявление, ставшее активным позже, догружается и за уже известные дни.
+    Прошедшие дни после загрузки не меняются и хранятся бессрочно,
+    текущий день считается устаревшим через ttl секунд. Если задано
+    хранилище, дни сохраняются в нём и переживают перезапуск.
+    """
+
+    def __init__(self, ttl, store=None):
+        self.ttl = ttl
+        self.store = store
+        self._lock = threading.Lock()
+        self._days = {}
+        self._loaded = {}
+        if store is not None:
+            for day, item_id, fetched_at, complete, values in (
+                    store.daily_stats()):
+                self._loaded.setdefault(day, {})[item_id] = (
+                    fetched_at, complete)
+                if values is not None:
+                    self._days.setdefault(day, {})[item_id] = values
+
+    def missing(self, days, item_ids):
+        """Объявления без свежих данных по дням: {день: [объявления]}."""
+        now = time.time()
+        missing = {}
+        with self._lock:
+            for day in days:
+                loaded = self._loaded.get(day, {})
+                day_items = [
+                    item_id for item_id in item_ids
+                    if not self._is_loaded(loaded.get(item_id), now)
+                ]
+                if day_items:
+                    missing[day] = day_items
+        return missing
+
+    def _is_loaded(self, state, now):
+        if state is None:
+            return False
+        fetched_at, complete = state
+        return complete or now - fetched_at < self.ttl
+
+    def put(self, day, item_ids, stats, complete):
+        """Сохранение дня по объявлениям item_ids.
+
+        Объявления без значений в stats за этот день загружены пустыми;
+        complete — день закончился.
+        """
+        now = time.time()
+        with self._lock:
+            day_stats = self._days.setdefault(day, {})
+            loaded = self._loaded.setdefault(day, {})
+            for item_id in item_ids:
+                day_stats.pop(item_id, None)
+                loaded[item_id] = (now, complete)
+            day_stats.update(stats)
+        if self.store is not None:
+            self.store.put_daily_stats(day, item_ids, stats, complete)
+
+    def get(self, day):
+        with self._lock:
+            return dict(self._days.get(day, {}))
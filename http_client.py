@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Ошибки, при которых запрос заведомо не дошёл до площадки
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+metrics.describe(
+    'arka_http_request_seconds', 'histogram',
+    'Время запроса к площадке вместе с повторами, с')
+metrics.describe(
+    'arka_http_responses_total', 'counter',
+    'Ответы площадок по кодам; error - сетевая ошибка')
+metrics.describe(
+    'arka_http_retries_total', 'counter', 'Повторы запросов к площадкам')
+
+
+def record_request(platform, status, seconds, retries=0):
+    """Учёт запроса к площадке в метриках."""
+    metrics.observe('arka_http_request_seconds', seconds, platform=platform)
+    metrics.inc('arka_http_responses_total', platform=platform, status=status)
+    if retries:
+        metrics.inc('arka_http_retries_total', retries, platform=platform)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """Адаптер, подставляющий таймаут во все запросы без явного таймаута.
+
+    Если задано имя площадки, время, код ответа и число повторов каждого
+    запроса учитываются в метриках. С limiter каждый запрос ждёт своей
+    очереди к площадке, а ответ 429 приостанавливает все запросы к ней
+    на Retry-After и повторяется не больше rate_limit_retries раз.
+    """
+
+    def __init__(self, *args, timeout=None, name=None, limiter=None,
+                 rate_limit_retries=0, backoff_factor=0, **kwargs):
+        self.timeout = timeout
+        self.name = name
+        self.limiter = limiter
+        self.rate_limit_retries = rate_limit_retries
+        self.backoff_factor = backoff_factor
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        if self.name is None:
+            return self.send_limited(request, **kwargs)
+
+        started = time.monotonic()
+        try:
+            response = self.send_limited(request, **kwargs)
+        except requests.RequestException:
+            record_request(self.name, 'error', time.monotonic() - started)
+            raise
+        retries = getattr(response.raw, 'retries', None)
+        record_request(
+            self.name, response.status_code, time.monotonic() - started,
+            len(retries.history) if retries is not None else 0)
+        return response
+
+    def send_limited(self, request, **kwargs):
+        if self.limiter is None:
+            return super().send(request, **kwargs)
+        for attempt in range(self.rate_limit_retries + 1):
+            self.limiter.acquire()
+            response = super().send(request, **kwargs)
+            if (response.status_code != 429
+                    or attempt == self.rate_limit_retries):
+                return response
+            self.limiter.pause(
+                retry_delay(response, attempt, self.backoff_factor))
+            response.close()
+
+
+def create_session(connect_timeout, read_timeout, retries, backoff_factor,
+                   pool_size, name=None, limiter=None, retry_post=False):
+    """Сессия площадки с keep-alive, таймаутами и повторами.
+
+    Повторяются сетевые ошибки и ответы 5xx/429 с экспоненциальной
+    задержкой (с учётом Retry-After). После исчерпания повторов
+    возвращается последний ответ, чтобы вызывающий код сам разобрал
+    код ответа. pool_block ограничивает число соединений на хост.
+    name — имя площадки для метрик. С limiter (RateLimiter) ответы 429
+    повторяет адаптер после общей для площадки паузы.
+
+    POST повторяется целиком только с retry_post — для площадок, где он
+    ничего не меняет. Иначе он повторяется лишь после ошибки соединения,
+    когда запрос не ушёл, чтобы не отправить сообщение дважды.
+    """
+    allowed_methods = Retry.DEFAULT_ALLOWED_METHODS
+    if retry_post:
+        allowed_methods = allowed_methods | {'POST'}
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[
+            status for status in RETRY_STATUSES
+            if limiter is None or status != 429
+        ],
+        allowed_methods=allowed_methods,
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=(connect_timeout, read_timeout),
+        max_retries=retry,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        pool_block=True,
+        name=name,
+        limiter=limiter,
+        rate_limit_retries=retries,
+        backoff_factor=backoff_factor,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def retry_delay(response, attempt, backoff_factor):
+    """Пауза перед повтором: Retry-After ответа или экспоненциальная."""
+    retry_after = None if response is None else (
+        response.headers.get('Retry-After'))
+    if retry_after and retry_after.isdigit():
+        return int(retry_after)
+    return backoff_factor * 2 ** attempt
+
+
+def create_async_client(connect_timeout, read_timeout, pool_size):
+    """Асинхронный клиент площадки с keep-alive и лимитом соединений."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size),
+    )
+
+
+async def async_request(client, method, url, retries, backoff_factor,
+                        platform=None, limiter=None, retry_post=False,
+                        **kwargs):
+    """Асинхронный запрос с теми же правилами повторов, что у сессий.
+
+    С именем площадки platform запрос учитывается в метриках, с limiter
+    ждёт очереди к площадке, а ответ 429 приостанавливает её целиком.
+    POST без retry_post повторяется только после ошибки соединения
+    и ответа 429, когда площадка его не выполнила.
+    """
+    idempotent = method.upper() != 'POST' or retry_post
+    started = time.monotonic()
+    for attempt in range(retries + 1):
+        response = None
+        if limiter is not None:
+            await limiter.async_acquire()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as error:
+            if attempt == retries or not (
+                    idempotent or isinstance(error, CONNECT_ERRORS)):
+                if platform is not None:
+                    record_request(
+                        platform, 'error', time.monotonic() - started,
+                        attempt)
+                raise
+        else:
+            retryable = response.status_code in RETRY_STATUSES and (
+                idempotent or response.status_code == 429)
+            if not retryable or attempt == retries:
+                if platform is not None:
+                    record_request(
+                        platform, response.status_code,
+                        time.monotonic() - started, attempt)
+                return response
+        delay = retry_delay(response, attempt, backoff_factor)
+        if limiter is not None and response is not None and (
+                response.status_code == 429):
+            limiter.pause(delay)
+            continue
+        await asyncio.sleep(delay)
@@ -0,0 +1,60 @@
+import time
+
+HOURGLASS = "⏳"
+
+
+class LookupReport:
+    """Сводный ответ на проверку листинга по всем площадкам.
+
+    Ответы площадок собираются в одно сообщение в порядке опроса, пока
+    не все площадки ответили, в конце перечислены ожидаемые. Сообщение
+    отправляется один раз и затем правится на месте; промежуточные правки
+    идут не чаще раза в interval секунд, итоговая — сразу.
+    """
+
+    def __init__(self, listing_id, platforms, max_length, interval):
+        self.listing_id = listing_id
+        self.platforms = list(platforms)
+        self.max_length = max_length
+        self.interval = interval
+        self.message_id = None
+        self.published_text = None
+        self.published_at = time.monotonic()
+        self._replies = {}
+
+    def add(self, platform, replies):
+        self._replies[platform] = list(replies)
+
+    def pending(self):
+        return [
+            platform for platform in self.platforms
+            if platform not in self._replies
+        ]
+
+    def is_complete(self):
+        return not self.pending()
+
+    def render(self):
+        parts = [f"Листинг {self.listing_id}:"]
+        for platform in self.platforms:
+            parts.extend(self._replies.get(platform, []))
+        if self.pending():
+            parts.append(
+                f"{HOURGLASS} Ждём ответа: {', '.join(self.pending())}")
+        text = "\n\n".join(parts)
+        if len(text) > self.max_length:
+            text = text[:self.max_length - 1] + "…"
+        return text
+
+    def wait_time(self):
+        """Через сколько секунд отправлять изменения; None — их нет."""
+        if self.render() == self.published_text:
+            return None
+        if self.is_complete():
+            return 0
+        return max(0, self.published_at + self.interval - time.monotonic())
+
+    def mark_published(self, text, message_id):
+        self.published_text = text
+        self.message_id = message_id
+        self.published_at = time.monotonic()
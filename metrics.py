@@ -0,0 +1,202 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы гистограмм времени по умолчанию, с
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Metrics:
+    """Счётчики, гистограммы и вычисляемые показатели с метками.
+
+    Все показатели отдаются текстом в формате Prometheus (render).
+    Описание (describe) задаёт тип, подсказку и границы гистограммы;
+    неописанные показатели считаются счётчиками.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds = {}
+        self._help = {}
+        self._buckets = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def describe(self, name, kind, help_text, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            self._kinds[name] = kind
+            self._help[name] = help_text
+            self._buckets[name] = tuple(buckets)
+
+    def add_gauge(self, name, help_text, collect):
+        """Показатель, вычисляемый при чтении.
+
+        collect() возвращает список пар (метки (dict), значение).
+        """
+        self.describe(name, 'gauge', help_text)
+        with self._lock:
+            self._gauges[name] = collect
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+            series = self._histograms.setdefault(name, {})
+            key = label_key(labels)
+            counts, total, count = series.get(
+                key, ([0] * len(buckets), 0, 0))
+            counts = [
+                bucket_count + (value <= bound)
+                for bucket_count, bound in zip(counts, buckets)
+            ]
+            series[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Замер времени блока в гистограмму name."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def counter(self, name, **labels):
+        """Значение счётчика; без меток — сумма по всем меткам."""
+        with self._lock:
+            series = self._counters.get(name, {})
+            if labels:
+                return series.get(label_key(labels), 0)
+            return sum(series.values())
+
+    def counters(self, name):
+        """Значения счётчика по меткам: список (метки (dict), значение)."""
+        with self._lock:
+            return [
+                (dict(key), value)
+                for key, value in sorted(self._counters.get(name, {}).items())
+            ]
+
+    def summary(self, name, **labels):
+        """Число наблюдений и их сумма в гистограмме."""
+        with self._lock:
+            _, total, count = self._histograms.get(name, {}).get(
+                label_key(labels), (None, 0, 0))
+            return count, total
+
+    def render(self):
+        with self._lock:
+            counters = {
+                name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: dict(series)
+                for name, series in self._histograms.items()}
+            gauges = dict(self._gauges)
+            kinds = dict(self._kinds)
+            help_texts = dict(self._help)
+            buckets = dict(self._buckets)
+
+        lines = []
+
+        def header(name, kind):
+            if name in help_texts:
+                lines.append(f'# HELP {name} {help_texts[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for name in sorted(counters):
+            header(name, kinds.get(name, 'counter'))
+            for key, value in sorted(counters[name].items()):
+                lines.append(f'{name}{format_labels(key)} {value}')
+        for name in sorted(histograms):
+            header(name, 'histogram')
+            for key, (counts, total, count) in sorted(
+                    histograms[name].items()):
+                for bound, bucket_count in zip(buckets[name], counts):
+                    lines.append(
+                        f'{name}_bucket'
+                        f'{format_labels(key, [("le", bound)])} '
+                        f'{bucket_count}')
+                lines.append(
+                    f'{name}_bucket{format_labels(key, [("le", "+Inf")])} '
+                    f'{count}')
+                lines.append(f'{name}_sum{format_labels(key)} {total}')
+                lines.append(f'{name}_count{format_labels(key)} {count}')
+        for name in sorted(gauges):
+            try:
+                values = gauges[name]()
+            except Exception as error:
+                logging.warning(
+                    "Не удалось вычислить показатель %s: %s", name, str(error))
+                continue
+            header(name, 'gauge')
+            for labels, value in values:
+                lines.append(
+                    f'{name}{format_labels(label_key(labels))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics для сборщика Prometheus."""
+
+    def __init__(self, registry, listen, port):
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer(
+            (listen, port), self._make_request_handler())
+        self.httpd.daemon_threads = True
+
+    def _make_request_handler(self):
+        registry = self.registry
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_response(HTTPStatus.NOT_FOUND)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = registry.render().encode()
+                self.send_response(HTTPStatus.OK)
+                self.send_header(
+                    'Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("Metrics: " + format, *args)
+
+        return RequestHandler
+
+    def start(self):
+        threading.Thread(
+            target=self.httpd.serve_forever, name='metrics', daemon=True
+        ).start()
+        logging.info(
+            "Метрики доступны на %s:%s/metrics",
+            *self.httpd.server_address[:2])
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
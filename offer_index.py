@@ -0,0 +1,119 @@
+import contextvars
+import logging
+import threading
+import time
+
+from metrics import metrics
+
+metrics.describe(
+    'arka_index_refresh_seconds', 'histogram',
+    'Время полной перезагрузки индекса площадки, с')
+metrics.describe(
+    'arka_index_refresh_errors_total', 'counter',
+    'Неудачные обновления индексов')
+
+
+class OfferIndex:
+    """Индекс объявлений площадки по внешнему идентификатору.
+
+    Загрузчик возвращает словарь {идентификатор: данные объявления}
+    или None, если данные на площадке не изменились. Индекс пересобирается
+    целиком и подменяется одной операцией, поэтому поиск не ждёт окончания
+    обновления. Запросы загрузчика идут с приоритетом вызывающего кода:
+    плановые обновления сами задают фоновый.
+    """
+
+    def __init__(self, name, loader, ttl):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.entries = {}
+        self.refreshed_at = None
+        self.last_error = None
+        self._loaded_at = None
+        self._last_refresh_ok = False
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Данные объявления или None."""
+        return self.entries.get(key)
+
+    def is_ready(self):
+        """Индекс хотя бы раз загружен."""
+        return self._loaded_at is not None
+
+    def is_fresh(self):
+        """Индекс загружен и не старше ttl."""
+        return (self.is_ready() and
+                time.monotonic() - self._loaded_at < self.ttl)
+
+    def is_refreshing(self):
+        return self._refresh_lock.locked()
+
+    def refresh(self):
+        """Полная перезагрузка индекса.
+
+        Если обновление уже идёт, дожидается его вместо второго запроса
+        и возвращает его результат: после неудачи индекс мог остаться
+        прежним, и ответ по нему нельзя считать свежим.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            with self._refresh_lock:
+                return self._last_refresh_ok
+        try:
+            started = time.monotonic()
+            entries = self.loader()
+        except Exception as error:
+            self.last_error = str(error)
+            self._last_refresh_ok = False
+            metrics.inc('arka_index_refresh_errors_total', index=self.name)
+            logging.error(
+                "Не удалось обновить индекс %s: %s", self.name, str(error))
+            return False
+        else:
+            if entries is not None:
+                self.entries = entries
+            self.last_error = None
+            self._last_refresh_ok = True
+            self._loaded_at = time.monotonic()
+            self.refreshed_at = time.time()
+            metrics.observe(
+                'arka_index_refresh_seconds', self._loaded_at - started,
+                index=self.name)
+            logging.info(
+                "Индекс %s обновлён: %s объявлений за %.1f с",
+                self.name, len(self.entries), self._loaded_at - started)
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def warm(self, entries, saved_at):
+        """Загрузка сохранённого снимка, если индекс ещё пуст.
+
+        Возраст снимка отсчитывается от saved_at, поэтому устаревший
+        снимок сразу считается несвежим и будет обновлён.
+        """
+        if self.is_ready():
+            return
+        self.entries = entries
+        self.refreshed_at = saved_at
+        self._loaded_at = time.monotonic() - max(0, time.time() - saved_at)
+        logging.info(
+            "Индекс %s загружен из хранилища: %s объявлений",
+            self.name, len(entries))
+
+    def refresh_in_background(self):
+        """Запуск обновления в отдельном потоке, если оно ещё не идёт.
+
+        Поток получает копию contextvars вызывающего, а с ней приоритет
+        запросов и trace_id проверки.
+        """
+        if self.is_refreshing():
+            return
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(self.refresh,),
+            name=f'{self.name}-index', daemon=True
+        ).start()
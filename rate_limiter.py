@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# Приоритет запросов текущего потока или задачи asyncio
+request_priority = ContextVar('request_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def background_priority():
+    """Запросы внутри блока уступают очередь проверкам пользователей."""
+    token = request_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def in_background(func):
+    """Декоратор: все запросы функции идут с фоновым приоритетом."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with background_priority():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class RateLimitTimeout(Exception):
+    """Запрос не дождался своей очереди к площадке."""
+
+
+class ConcurrencyLimit:
+    """Счётчик выполняемых задач с верхней границей (0 — без ограничения).
+
+    try_acquire не ждёт: при исчерпании лимита задачу нужно отклонить.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.limit and self.active >= self.limit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def acquire(self):
+        """Место без проверки лимита: задача продолжается вне пула."""
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+class RateLimiter:
+    """Очередь запросов к площадке по алгоритму token bucket.
+
+    rate — запросов в секунду (0 — без ограничения), burst — сколько
+    запросов можно отправить подряд. Фоновые запросы ждут, пока в очереди
+    есть интерактивные. Интерактивный запрос, которому пришлось бы ждать
+    дольше max_wait, сразу получает RateLimitTimeout: при перегрузке
+    пользователь быстро узнаёт об этом, а не ждёт таймаута площадки.
+    pause останавливает все запросы к площадке, например по Retry-After.
+    """
+
+    def __init__(self, name, rate, burst, max_wait):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_wait = max_wait
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.rejected = 0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._condition = threading.Condition()
+
+    def _reserve(self, priority):
+        """Взятие токена под блокировкой; 0 или сколько ещё ждать, с."""
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now < self._paused_until:
+            return self._paused_until - now
+        if priority == BACKGROUND and self.waiting[INTERACTIVE]:
+            # Точное время неизвестно: проснёмся, когда очередь сдвинется
+            return 1 / self.rate if self.rate > 0 else 0.05
+        if self.rate <= 0:
+            return 0
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _check_wait(self, deadline, wait):
+        if deadline is not None and time.monotonic() + wait > deadline:
+            self.rejected += 1
+            raise RateLimitTimeout(
+                f"{self.name}: очередь запросов длиннее {self.max_wait} с")
+
+    def _deadline(self, priority):
+        if priority == INTERACTIVE and self.max_wait:
+            return time.monotonic() + self.max_wait
+        return None
+
+    def acquire(self):
+        """Ожидание очереди на запрос в текущем потоке."""
+        priority = request_priority.get()
+        deadline = self._deadline(priority)
+        with self._condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    wait = self._reserve(priority)
+                    if not wait:
+                        return
+                    self._check_wait(deadline, wait)
+                    self._condition.wait(wait)
+            finally:
+                self.waiting[priority] -= 1
+                self._condition.notify_all()
+
+    async def async_acquire(self):
+        """Ожидание очереди на запрос в корутине."""
+        priority = request_priority.get()
+        deadline = self._deadline(priority)
+        with self._condition:
+            self.waiting[priority] += 1
+        try:
+            while True:
+                with self._condition:
+                    wait = self._reserve(priority)
+                    if not wait:
+                        return
+                    self._check_wait(deadline, wait)
+                await asyncio.sleep(wait)
+        finally:
+            with self._condition:
+                self.waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def pause(self, seconds):
+        """Остановка всех запросов к площадке на seconds секунд."""
+        with self._condition:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + seconds)
+        logging.warning(
+            "Запросы к %s приостановлены на %s с", self.name, seconds)
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+from cachetools import TTLCache
+
+
+class ResultCache:
+    """Кэш результатов проверок с TTL и ограничением размера (LRU).
+
+    Одновременные запросы с одинаковым ключом не дублируются: первый
+    вычисляет результат, остальные ждут его. Ошибки не кэшируются:
+    обработчик, не получивший окончательного ответа площадки, должен
+    выбросить исключение, а не вернуть текст ошибки.
+    Записи хранятся со временем создания, чтобы их можно было сохранить
+    перед остановкой и восстановить с оставшимся сроком жизни.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._async_in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
+
+    def _cached(self, key, refresh):
+        """Результат из кэша; под блокировкой."""
+        if refresh or key not in self._cache:
+            return None, False
+        created_at, result = self._cache[key]
+        if time.time() - created_at >= self.ttl:
+            return None, False
+        self.hits += 1
+        return result, True
+
+    def _store(self, key, result, created_at=None):
+        with self._lock:
+            self._cache[key] = (created_at or time.time(), result)
+
+    def items(self):
+        """Живые записи: список (ключ, время создания, результат)."""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, created_at, result)
+                for key, (created_at, result) in list(self._cache.items())
+                if now - created_at < self.ttl
+            ]
+
+    def restore(self, items):
+        """Загрузка сохранённых записей с учётом их возраста."""
+        now = time.time()
+        for key, created_at, result in items:
+            if now - created_at < self.ttl:
+                self._store(key, result, created_at)
+
+    def get_or_compute(self, key, compute, refresh=False):
+        """Результат из кэша или compute(); refresh пропускает кэш."""
+        with self._lock:
+            result, found = self._cached(key, refresh)
+            if found:
+                return result
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._in_flight[key] = future
+                self.misses += 1
+        if not is_owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            self._store(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    async def async_get_or_compute(self, key, compute, refresh=False):
+        """Асинхронный вариант get_or_compute для корутины compute().
+
+        Общая задача защищена от отмены, чтобы таймаут одного ожидающего
+        не прерывал проверку для остальных.
+        """
+        with self._lock:
+            result, found = self._cached(key, refresh)
+            if found:
+                return result
+        task = self._async_in_flight.get(key)
+        if task is None:
+            with self._lock:
+                self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._async_in_flight[key] = task
+
+            def on_done(done_task):
+                self._async_in_flight.pop(key, None)
+                if not done_task.cancelled() and done_task.exception() is None:
+                    self._store(key, done_task.result())
+
+            task.add_done_callback(on_done)
+        return await asyncio.shield(task)
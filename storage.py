@@ -0,0 +1,184 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class ListingStore:
+    """Локальное хранилище SQLite с данными площадок по листингам.
+
+    Для каждой площадки хранится последний полный снимок: объявления
+    по номеру листинга и время синхронизации. Таблица cache хранит
+    значения со сроком годности (токены, кэш ответов), чтобы после
+    перезапуска бот не начинал с пустыми кэшами.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS listings ('
+                'platform TEXT NOT NULL, listing_id TEXT NOT NULL, '
+                'data TEXT NOT NULL, PRIMARY KEY (platform, listing_id))')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS syncs ('
+                'platform TEXT PRIMARY KEY, synced_at REAL NOT NULL, '
+                'size INTEGER NOT NULL)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS watches ('
+                'chat_id INTEGER NOT NULL, listing_id TEXT NOT NULL, '
+                'PRIMARY KEY (chat_id, listing_id))')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS watch_snapshots ('
+                'platform TEXT NOT NULL, listing_id TEXT NOT NULL, '
+                'data TEXT NOT NULL, PRIMARY KEY (platform, listing_id))')
+            # Прежняя таблица хранила день целиком, без объявлений
+            self._conn.execute('DROP TABLE IF EXISTS daily_stats')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS item_daily_stats ('
+                'day TEXT NOT NULL, item_id INTEGER NOT NULL, '
+                'fetched_at REAL NOT NULL, complete INTEGER NOT NULL, '
+                'data TEXT, PRIMARY KEY (day, item_id))')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, expires_at REAL NOT NULL, '
+                'data TEXT NOT NULL)')
+
+    def replace_platform(self, platform, entries, synced_at=None):
+        """Замена снимка площадки целиком одной транзакцией.
+
+        synced_at — время, на которое актуальны данные (по умолчанию сейчас).
+        """
+        rows = [
+            (platform, str(listing_id), json.dumps(entry, ensure_ascii=False))
+            for listing_id, entry in entries.items()
+            if listing_id is not None
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM listings WHERE platform = ?', (platform,))
+            self._conn.executemany(
+                'INSERT INTO listings VALUES (?, ?, ?)', rows)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)',
+                (platform, synced_at or time.time(), len(rows)))
+
+    def get(self, platform, listing_id):
+        """Данные объявления или None."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM listings WHERE platform = ? '
+                'AND listing_id = ?', (platform, listing_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def entries(self, platform):
+        """Снимок площадки: {листинг: данные}."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT listing_id, data FROM listings WHERE platform = ?',
+                (platform,)).fetchall()
+        return {listing_id: json.loads(data) for listing_id, data in rows}
+
+    def listing_ids(self, platform):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT listing_id FROM listings WHERE platform = ?',
+                (platform,)).fetchall()
+        return {row[0] for row in rows}
+
+    def synced_at(self, platform):
+        """Время последней синхронизации площадки или None."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT synced_at FROM syncs WHERE platform = ?',
+                (platform,)).fetchone()
+        return row[0] if row else None
+
+    def watches(self):
+        """Подписки на изменения: список (чат, листинг)."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT chat_id, listing_id FROM watches').fetchall()
+
+    def add_watch(self, chat_id, listing_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO watches VALUES (?, ?)',
+                (chat_id, listing_id))
+
+    def remove_watch(self, chat_id, listing_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM watches WHERE chat_id = ? AND listing_id = ?',
+                (chat_id, listing_id))
+
+    def watch_snapshots(self):
+        """Последние снимки отслеживаемых листингов: (площадка, листинг,
+        снимок в JSON).
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT platform, listing_id, data FROM watch_snapshots'
+            ).fetchall()
+
+    def put_watch_snapshots(self, platform, snapshots):
+        """Сохранение снимков площадки {листинг: снимок в JSON}."""
+        rows = [
+            (platform, listing_id, data)
+            for listing_id, data in snapshots.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO watch_snapshots VALUES (?, ?, ?)',
+                rows)
+
+    def remove_watch_snapshots(self, listing_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM watch_snapshots WHERE listing_id = ?',
+                (listing_id,))
+
+    def daily_stats(self):
+        """Посуточная статистика: (день, объявление, загружен, завершён,
+        значения или None).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT day, item_id, fetched_at, complete, data '
+                'FROM item_daily_stats').fetchall()
+        return [
+            (day, item_id, fetched_at, bool(complete),
+             tuple(json.loads(data)) if data is not None else None)
+            for day, item_id, fetched_at, complete, data in rows
+        ]
+
+    def put_daily_stats(self, day, item_ids, stats, complete):
+        fetched_at = time.time()
+        rows = [
+            (day, item_id, fetched_at, int(complete),
+             json.dumps(stats[item_id]) if item_id in stats else None)
+            for item_id in item_ids
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO item_daily_stats '
+                'VALUES (?, ?, ?, ?, ?)', rows)
+
+    def get_cached(self, key):
+        """Значение из кэша или None, если его нет или срок истёк."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT expires_at, data FROM cache WHERE key = ?',
+                (key,)).fetchone()
+        if row is None or row[0] <= time.time():
+            return None
+        return json.loads(row[1])
+
+    def put_cached(self, key, value, expires_at):
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                (key, expires_at, data))
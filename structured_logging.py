@@ -0,0 +1,127 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import (QueueHandler, QueueListener,
+                              RotatingFileHandler)
+
+# Идентификатор текущей проверки и площадка для записей журнала
+trace_id = contextvars.ContextVar('trace_id', default='-')
+log_platform = contextvars.ContextVar('log_platform', default=None)
+
+# Поля из extra, которые попадают в JSON-запись
+EXTRA_FIELDS = ('listing_id', 'latency_ms', 'outcome')
+
+
+@contextmanager
+def lookup_trace():
+    """Блок одной проверки: все записи внутри получают общий trace_id."""
+    token = trace_id.set(uuid.uuid4().hex[:12])
+    try:
+        yield trace_id.get()
+    finally:
+        trace_id.reset(token)
+
+
+@contextmanager
+def platform_context(platform):
+    """Записи внутри блока помечаются площадкой."""
+    token = log_platform.set(platform)
+    try:
+        yield
+    finally:
+        log_platform.reset(token)
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """executor.submit с копией contextvars вызывающего потока.
+
+    Задача видит trace_id проверки и приоритет запросов к площадкам.
+    """
+    return executor.submit(
+        contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись trace_id и площадку из contextvars.
+
+    Стоит на QueueHandler, поэтому срабатывает в потоке, писавшем запись.
+    """
+
+    def filter(self, record):
+        record.trace_id = trace_id.get()
+        if getattr(record, 'platform', None) is None:
+            record.platform = log_platform.get()
+        return True
+
+
+class PassThroughQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись сам.
+
+    Стандартный prepare склеивает сообщение с трассировкой и убирает
+    exc_info, и исключение уже не попадает в поле exc JSON-записи. Здесь
+    подставляются только аргументы сообщения, а исключение форматирует
+    обработчик файла.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись журнала — одна строка JSON."""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(
+                record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'trace_id': getattr(record, 'trace_id', '-'),
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'platform', None) is not None:
+            data['platform'] = record.platform
+        for field in EXTRA_FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(path, level, max_bytes, backup_count, json_format):
+    """Журнал через очередь: запись в файл идёт в отдельном потоке.
+
+    Потоки обработчиков только кладут запись в очередь, а QueueListener
+    пишет её в файл с ротацией. Возвращает запущенный QueueListener.
+    """
+    file_handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count,
+        encoding='utf-8')
+    if json_format:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] '
+            '%(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = PassThroughQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(
+        log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,60 @@
+import threading
+
+from cachetools import TTLCache
+from telegram.error import RetryAfter
+
+from rate_limiter import RateLimiter
+
+
+class TelegramSender:
+    """Очередь исходящих сообщений Telegram с лимитами бота и чата.
+
+    Telegram допускает около 30 сообщений в секунду на бота и около одного
+    в секунду в один чат, правки сообщений считаются так же. Каждый вызов
+    ждёт очереди в обоих лимитах; ответ RetryAfter приостанавливает чат,
+    и вызов повторяется один раз.
+    """
+
+    def __init__(self, rate, burst, chat_rate, chat_burst):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.bot_limiter = RateLimiter('Telegram', rate, burst, 0)
+        self._chat_limiters = TTLCache(maxsize=10000, ttl=600)
+        self._lock = threading.Lock()
+
+    def chat_limiter(self, chat_id):
+        with self._lock:
+            limiter = self._chat_limiters.get(chat_id)
+            if limiter is None:
+                limiter = RateLimiter(
+                    f'Telegram {chat_id}', self.chat_rate, self.chat_burst, 0)
+            # Повторная запись продлевает срок жизни активного чата
+            self._chat_limiters[chat_id] = limiter
+            return limiter
+
+    def call(self, chat_id, request):
+        """Вызов request() в очереди чата chat_id."""
+        chat_limiter = self.chat_limiter(chat_id)
+        for attempt in range(2):
+            chat_limiter.acquire()
+            self.bot_limiter.acquire()
+            try:
+                return request()
+            except RetryAfter as error:
+                if attempt:
+                    raise
+                chat_limiter.pause(error.retry_after)
+
+    def send(self, bot, chat_id, text):
+        return self.call(
+            chat_id, lambda: bot.send_message(chat_id=chat_id, text=text))
+
+    def edit(self, bot, chat_id, message_id, text):
+        return self.call(
+            chat_id, lambda: bot.edit_message_text(
+                text, chat_id=chat_id, message_id=message_id))
+
+    async def async_acquire(self, chat_id):
+        """Ожидание очереди чата в корутине."""
+        await self.chat_limiter(chat_id).async_acquire()
+        await self.bot_limiter.async_acquire()
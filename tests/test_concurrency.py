@@ -0,0 +1,100 @@
+"""Одновременные проверки разных листингов на заглушке площадок.
+
+Каждый чат проверяет свой листинг; ни один ответ не должен содержать
+чужой листинг.
+"""
+import re
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# Окружение бенчмарка (заглушечные токены, без базы и лимитов) задаётся
+# до импорта бота
+from benchmarks import run_benchmark
+from benchmarks.fixtures import Fixtures
+from benchmarks.stub_server import StubServer
+
+import arka_bot
+from telegram import Bot
+from telegram.utils.request import Request
+
+LOOKUPS = 32
+
+
+class ConcurrentLookupTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fixtures = Fixtures(LOOKUPS * 3, None)
+        cls.stub = StubServer(
+            cls.fixtures, arka_bot.YANDEX_PAGE_SIZE, latency=0.01)
+        cls.stub.start()
+        run_benchmark.point_bot_to_stub(cls.stub.base_url)
+        cls.bot = Bot(
+            arka_bot.TELEGRAM_TOKEN_AVITO,
+            base_url=f'{cls.stub.base_url}/bot',
+            request=Request(con_pool_size=LOOKUPS + 4))
+
+    @classmethod
+    def tearDownClass(cls):
+        if arka_bot.async_loop.is_running():
+            arka_bot.async_loop.submit(
+                arka_bot.close_async_clients()).result()
+            arka_bot.async_loop.stop()
+        cls.stub.stop()
+
+    def setUp(self):
+        run_benchmark.reset_bot_state()
+        self.stub.reset()
+        # Разные листинги, включая отсутствующий на всех площадках
+        listing_ids = self.fixtures.listing_ids()[::3][:LOOKUPS - 1]
+        self.lookups = dict(enumerate(listing_ids + ['99999'], start=1))
+
+    def assert_own_replies(self):
+        self.assertEqual(
+            run_benchmark.count_mismatches(self.stub.messages, self.lookups),
+            0)
+        for chat_id, listing_id in self.lookups.items():
+            messages = self.stub.messages.get(chat_id)
+            self.assertTrue(messages, f"чат {chat_id} без ответа")
+            final = messages[-1]
+            self.assertTrue(final.startswith(f"Листинг {listing_id}:"))
+            if listing_id != '99999':
+                self.assertEqual(
+                    set(re.findall(r'/(\d{5})\b', final)), {listing_id})
+
+    def run_threads(self):
+        def lookup(chat_id):
+            update = run_benchmark.make_update(
+                self.bot, chat_id, self.lookups[chat_id])
+            context = run_benchmark.SimpleNamespace(bot=self.bot, args=[])
+            arka_bot.handle_user_input(update, context)
+
+        with ThreadPoolExecutor(max_workers=LOOKUPS) as executor:
+            list(executor.map(lookup, self.lookups))
+
+    def test_concurrent_threads(self):
+        self.run_threads()
+        self.assert_own_replies()
+
+    def test_concurrent_threads_with_warm_indexes(self):
+        arka_bot.cian_index.refresh()
+        arka_bot.yandex_index.refresh()
+        arka_bot.domclick_index.refresh()
+        self.run_threads()
+        self.assert_own_replies()
+
+    def test_concurrent_async(self):
+        if not arka_bot.async_loop.is_running():
+            arka_bot.async_loop.start()
+        futures = [
+            arka_bot.async_loop.submit(arka_bot.async_handle_user_input(
+                chat_id, arka_bot.LookupResult(listing_id)))
+            for chat_id, listing_id in self.lookups.items()
+        ]
+        for future in futures:
+            future.result(timeout=60)
+        self.assert_own_replies()
+
+
+if __name__ == '__main__':
+    unittest.main()
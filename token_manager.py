@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+
+from metrics import metrics
+
+metrics.describe(
+    'arka_token_refresh_total', 'counter',
+    'Запросы новых токенов площадок по результату')
+
+
+class TokenManager:
+    """OAuth-токен площадки с учётом срока действия.
+
+    fetcher возвращает пару (access_token, expires_in) или None при ошибке.
+    Одновременные обновления схлопываются в один запрос: потоки, ожидавшие
+    блокировку, получают токен, полученный первым из них. Если задано
+    хранилище, токен сохраняется в нём и переживает перезапуск.
+    """
+
+    def __init__(self, name, fetcher, refresh_margin, store=None):
+        self.name = name
+        self.fetcher = fetcher
+        self.refresh_margin = refresh_margin
+        self.store = store
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        if store is not None:
+            saved = store.get_cached(self._store_key())
+            if saved is not None:
+                self._token, self._expires_at = saved
+                logging.info(
+                    "Токен %s загружен из хранилища, действует %.0f с",
+                    name, self.expires_in())
+
+    def _store_key(self):
+        return f'token:{self.name}'
+
+    def expires_in(self):
+        """Сколько секунд токен ещё действителен."""
+        return max(0, self._expires_at - time.time())
+
+    def is_valid(self):
+        return self._token is not None and self.expires_in() > 0
+
+    def needs_refresh(self):
+        """Токена нет или он скоро истечёт."""
+        return self.expires_in() <= self.refresh_margin
+
+    def cached(self):
+        """Действующий токен без обращения к площадке или None."""
+        token = self._token
+        return token if self.is_valid() else None
+
+    def get(self):
+        """Действующий токен; при необходимости получает новый."""
+        token = self._token
+        if self.is_valid():
+            return token
+        return self.refresh(stale_token=token)
+
+    def refresh(self, stale_token=None):
+        """Получение нового токена взамен stale_token."""
+        with self._lock:
+            if (self._token is not None and self._token != stale_token
+                    and self.is_valid()):
+                return self._token
+            result = self.fetcher()
+            if result is None:
+                metrics.inc(
+                    'arka_token_refresh_total', token=self.name,
+                    outcome='error')
+                logging.warning("Не удалось обновить токен %s", self.name)
+                return None
+            token, expires_in = result
+            self._token = token
+            self._expires_at = time.time() + expires_in
+            if self.store is not None:
+                self.store.put_cached(
+                    self._store_key(), [token, self._expires_at],
+                    self._expires_at)
+            metrics.inc(
+                'arka_token_refresh_total', token=self.name, outcome='ok')
+            logging.info(
+                "Токен %s обновлён, действует %s с", self.name, expires_in)
+            return token
+
+    def refresh_if_needed(self):
+        """Упреждающее обновление до истечения срока действия."""
+        if self.needs_refresh():
+            self.refresh(stale_token=self._token)
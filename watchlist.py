@@ -0,0 +1,96 @@
+import json
+import threading
+
+# Нет снимка: листинг ещё не проверялся после подписки
+UNKNOWN = object()
+
+
+class WatchList:
+    """Подписки чатов на изменения листингов и последние снимки площадок.
+
+    Снимок — компактное представление объявления, в которое входят только
+    отслеживаемые поля (статус, ссылка, ошибки). Один проход по фиду
+    площадки сравнивает снимки всех отслеживаемых листингов сразу,
+    сколько бы чатов на них ни было подписано. Снимки хранятся в JSON.
+    Если задано хранилище, подписки и снимки сохраняются в нём
+    и переживают перезапуск: изменения, случившиеся, пока бот был
+    остановлен, приходят первой проверкой после запуска.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._lock = threading.Lock()
+        self._chats = {}
+        self._snapshots = {}
+        if store is not None:
+            for chat_id, listing_id in store.watches():
+                self._chats.setdefault(listing_id, set()).add(chat_id)
+            for platform, listing_id, data in store.watch_snapshots():
+                self._snapshots[(platform, listing_id)] = data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._chats)
+
+    def subscribe(self, chat_id, listing_id):
+        """Подписка чата; False, если она уже была."""
+        with self._lock:
+            chats = self._chats.setdefault(listing_id, set())
+            if chat_id in chats:
+                return False
+            chats.add(chat_id)
+        if self.store is not None:
+            self.store.add_watch(chat_id, listing_id)
+        return True
+
+    def unsubscribe(self, chat_id, listing_id):
+        """Отписка чата; False, если подписки не было."""
+        with self._lock:
+            chats = self._chats.get(listing_id, set())
+            if chat_id not in chats:
+                return False
+            chats.discard(chat_id)
+            forget = not chats
+            if forget:
+                del self._chats[listing_id]
+                for key in [key for key in self._snapshots
+                            if key[1] == listing_id]:
+                    del self._snapshots[key]
+        if self.store is not None:
+            self.store.remove_watch(chat_id, listing_id)
+            if forget:
+                self.store.remove_watch_snapshots(listing_id)
+        return True
+
+    def listing_ids(self, chat_id=None):
+        """Отслеживаемые листинги, все или одного чата."""
+        with self._lock:
+            return sorted(
+                listing_id for listing_id, chats in self._chats.items()
+                if chat_id is None or chat_id in chats)
+
+    def update(self, platform, snapshots):
+        """Сравнение новых снимков площадки с прошлыми.
+
+        snapshots — {листинг: снимок или None, если объявления нет}.
+        Возвращает список (листинг, чаты) для изменившихся листингов;
+        первый снимок после подписки только запоминается.
+        """
+        changes = []
+        changed = {}
+        with self._lock:
+            for listing_id, snapshot in snapshots.items():
+                chats = self._chats.get(listing_id)
+                if not chats:
+                    continue
+                key = (platform, listing_id)
+                data = json.dumps(snapshot, ensure_ascii=False)
+                previous = self._snapshots.get(key, UNKNOWN)
+                if previous == data:
+                    continue
+                self._snapshots[key] = changed[listing_id] = data
+                if previous is not UNKNOWN:
+                    changes.append((listing_id, sorted(chats)))
+        if self.store is not None and changed:
+            self.store.put_watch_snapshots(platform, changed)
+        return changes
@@ -0,0 +1,104 @@
+import json
+import logging
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram import Update
+
+# Обновления Telegram не бывают больше нескольких килобайт
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookServer:
+    """Приём обновлений Telegram по HTTP с ограничением нагрузки.
+
+    Одновременно обрабатывается не больше max_concurrency запросов, а когда
+    backlog() — невыполненная работа бота — достигает max_backlog, новые
+    обновления отклоняются ответом 503 с Retry-After: Telegram доставит их
+    повторно позже, и бот не копит работу, которую не успевает выполнить.
+    По умолчанию backlog — длина очереди диспетчера. Если задан secret,
+    принимаются только запросы с заголовком
+    X-Telegram-Bot-Api-Secret-Token с этим значением.
+    """
+
+    def __init__(self, dispatcher, listen, port, url_path, max_concurrency,
+                 max_backlog, backlog=None, secret=None):
+        self.dispatcher = dispatcher
+        self.url_path = '/' + url_path.lstrip('/')
+        self.max_backlog = max_backlog
+        self.backlog = backlog or dispatcher.update_queue.qsize
+        self.secret = secret
+        self.accepted = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._thread = None
+        self.httpd = ThreadingHTTPServer(
+            (listen, port), self._make_request_handler())
+        self.httpd.daemon_threads = True
+
+    def _make_request_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.handle_post(self)
+
+            def log_message(self, format, *args):
+                logging.debug("Webhook: " + format, *args)
+
+        return RequestHandler
+
+    @staticmethod
+    def reply(request, status, retry_after=None):
+        request.send_response(status)
+        if retry_after is not None:
+            request.send_header('Retry-After', str(retry_after))
+        request.send_header('Content-Length', '0')
+        request.end_headers()
+
+    def reject(self, request, reason):
+        self.rejected += 1
+        logging.warning(
+            "Webhook перегружен (%s), обновление отклонено", reason)
+        self.reply(request, HTTPStatus.SERVICE_UNAVAILABLE, retry_after=1)
+
+    def handle_post(self, request):
+        if request.path != self.url_path:
+            return self.reply(request, HTTPStatus.NOT_FOUND)
+        if self.secret and (request.headers.get(
+                'X-Telegram-Bot-Api-Secret-Token') != self.secret):
+            return self.reply(request, HTTPStatus.FORBIDDEN)
+        if not self._slots.acquire(blocking=False):
+            return self.reject(request, "занят")
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+            if not 0 < length <= MAX_BODY_SIZE:
+                return self.reply(request, HTTPStatus.BAD_REQUEST)
+            try:
+                data = json.loads(request.rfile.read(length))
+            except ValueError:
+                return self.reply(request, HTTPStatus.BAD_REQUEST)
+            if self.backlog() >= self.max_backlog:
+                return self.reject(request, "очередь")
+
+            update = Update.de_json(data, self.dispatcher.bot)
+            self.dispatcher.update_queue.put(update)
+            self.accepted += 1
+            self.reply(request, HTTPStatus.OK)
+        finally:
+            self._slots.release()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name='webhook', daemon=True)
+        self._thread.start()
+        # Путь по умолчанию секретный, поэтому в журнал не пишется
+        logging.info(
+            "Webhook слушает %s:%s", *self.httpd.server_address[:2])
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
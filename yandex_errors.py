@@ -0,0 +1,80 @@
+import functools
+import logging
+import threading
+import time
+
+from yandex_errors_dict import ya_error_lib
+
+
+@functools.lru_cache(maxsize=1024)
+def describe_errors(codes):
+    """Описания кодов ошибок без повторов; неизвестные — вместе с кодом."""
+    descriptions = []
+    for code in codes:
+        description = ya_error_lib.get(code, f'Неизвестная ошибка ({code})')
+        if description not in descriptions:
+            descriptions.append(description)
+    return tuple(descriptions)
+
+
+class YandexErrorStats:
+    """Сводка ошибок фида Яндекса по кодам.
+
+    update получает фид после каждого обновления индекса и пересчитывает
+    только листинги, у которых изменился набор ошибок. Коды, которых нет
+    в каталоге, при первом появлении попадают в журнал с листингом.
+    """
+
+    def __init__(self, examples=5):
+        self.examples = examples
+        self.total = 0
+        self.updated_at = None
+        self._errors = {}
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def update(self, entries):
+        """Пересчёт по новому фиду {листинг: список объявлений}."""
+        errors = {}
+        for listing_id, listing_entries in entries.items():
+            codes = tuple(
+                code for entry in listing_entries for code in entry["errors"])
+            if listing_id is not None and codes:
+                errors[listing_id] = codes
+        with self._lock:
+            for listing_id in set(self._errors) | set(errors):
+                old_codes = set(self._errors.get(listing_id, ()))
+                new_codes = set(errors.get(listing_id, ()))
+                for code in old_codes - new_codes:
+                    self._listings[code].discard(listing_id)
+                    if not self._listings[code]:
+                        del self._listings[code]
+                for code in new_codes - old_codes:
+                    if code not in self._listings:
+                        self._listings[code] = set()
+                        if code not in ya_error_lib:
+                            logging.warning(
+                                "Неизвестный код ошибки Яндекса %s, "
+                                "листинг %s", code, listing_id)
+                    self._listings[code].add(listing_id)
+            self._errors = errors
+            self.total = len(entries)
+            self.updated_at = time.time()
+
+    def affected(self):
+        """Объявлений хотя бы с одной ошибкой."""
+        with self._lock:
+            return len(self._errors)
+
+    def summary(self):
+        """Список (код, описание или None, число листингов, примеры).
+
+        Отсортирован по убыванию числа листингов.
+        """
+        with self._lock:
+            items = [
+                (code, ya_error_lib.get(code), len(listings),
+                 sorted(listings)[:self.examples])
+                for code, listings in self._listings.items()
+            ]
+        return sorted(items, key=lambda item: (-item[2], item[0]))